@@ -1,5 +1,7 @@
 import pygame
 
+from cache import circle_image
+
 class Particle(pygame.sprite.Sprite):
     def __init__(self, position, velocity, radius, density, groups):
         super().__init__(groups)
@@ -15,10 +17,8 @@ class Particle(pygame.sprite.Sprite):
         rg_value = 200 - density * 10
         self.color = pygame.Color(rg_value, rg_value, 255)
 
-        self.image = pygame.Surface((2 * radius, 2 * radius))
-        self.image.fill('black')
-        self.image.set_colorkey('black')
-        pygame.draw.circle(self.image, self.color, (radius, radius), radius)
+        # 相同半径和颜色的粒子共享同一个图像
+        self.image = circle_image(radius, self.color)
         self.rect = self.image.get_rect(center = self.position)
 
     def bounce(self):
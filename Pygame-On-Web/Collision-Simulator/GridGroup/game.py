@@ -9,6 +9,7 @@ import math
 from debug import Debug
 from particle import Particle
 from grid import GridGroup
+from sortgrid import SortGridGroup
 
 class Game:
 
@@ -66,7 +67,11 @@ class Game:
 
         particles = pygame.sprite.Group()
         grid = GridGroup(max_radius * 2)
-        self.generate(max_radius, [particles, grid], grid)
+        # 基于计数排序的网格，每帧 O(n) 重建网格成员，按 S 键与 GridGroup 切换对比
+        sort_grid = SortGridGroup(max_radius * 2)
+        # 粒子同时加入两个网格，切换后 regrid() 会将粒子移入当前所处的网格
+        groups = [particles, grid, sort_grid]
+        self.generate(max_radius, groups, grid)
         # 记录并显示游戏中粒子总数
         total_num = 1
 
@@ -75,6 +80,7 @@ class Game:
         # False：游戏结束
         game_running = True
         gridding = False
+        sorting = False
         # 游戏主循环
         while game_running:
             # 按照给定的 FPS 刷新游戏
@@ -97,21 +103,25 @@ class Game:
                     if event.key == pygame.K_p:
                         total_num += 100
                         for i in range(100):
-                            self.generate(max_radius, [particles, grid], grid)
+                            self.generate(max_radius, groups, grid)
                     # 按 G 键切换碰撞检测算法
                     if event.key == pygame.K_g:
                         gridding = not gridding
+                    # 按 S 键切换网格的实现方式
+                    if event.key == pygame.K_s:
+                        sorting = not sorting
 
             # 以背景色覆盖刷新游戏界面
             screen.fill(screen_color)
 
             if gridding or total_num > 801:
-                # 调用 GridGroup 类的 update() 函数，更新粒子状态
-                grid.update(dt)
-                # 调用 GridGroup 类的 draw() 函数，绘制粒子
-                grid.draw(screen)
+                active = sort_grid if sorting else grid
+                # 调用网格群组的 update() 函数，更新粒子状态
+                active.update(dt)
+                # 调用网格群组的 draw() 函数，绘制粒子
+                active.draw(screen)
                 # 调用 debug 函数在游戏界面右上角显示碰撞检测算法
-                debug.debug("Gridding", 'red', 'topright')
+                debug.debug("Sort gridding" if sorting else "Gridding", 'red', 'topright')
             else:
                 list_particles = particles.sprites()
                 # 每对粒子都进行碰撞检测
@@ -18,11 +18,30 @@ class GridGroup(pygame.sprite.Group):
             for col in range(self.Ncol):
                 self.grid[row].append([])
 
+        # 只需检测右下方向网格中的粒子
+        adjoin = ((1, -1), (1, 0), (1, 1), (0, 1))
+        # 预先计算每个网格的相邻网格列表，碰撞检测时不再判断是否超出网格上下限
+        self.neighbors = []
+        for row in range(self.Nrow):
+            self.neighbors.append([])
+            for col in range(self.Ncol):
+                boxes = []
+                for (drow, dcol) in adjoin:
+                    next_row = row + drow
+                    next_col = col + dcol
+                    if self.in_grid(next_row, next_col):
+                        boxes.append(self.grid[next_row][next_col])
+                self.neighbors[row].append(boxes)
+
+        # 记录所有非空网格的行列坐标，只遍历有粒子的网格
+        self.occupied = set()
+
     def add2grid(self, sprite):
         # 根据粒子的位置，将粒子放入相应的网格中
         row = int(sprite.position.x / self.size)
         col = int(sprite.position.y / self.size)
         self.grid[row][col].append(sprite)
+        self.occupied.add((row, col))
 
     def in_grid(self, row, col):
         # 判断行列坐标是否超出网格上下限
@@ -33,45 +52,43 @@ class GridGroup(pygame.sprite.Group):
 
     def regrid(self):
         # 粒子移动之后，进行碰撞检测之前，更新粒子所处的网格
-        for row in range(self.Nrow):
-            for col in range(self.Ncol):
-                box = self.grid[row][col]
-                # outside 列表存放离开网格的粒子
-                outside = []
-                for sprite in box:
-                    now_row = int(sprite.position.x / self.size)
-                    now_col = int(sprite.position.y / self.size)
-                    # 判断粒子是否离开原先的网格
-                    if (now_row != row) or (now_col != col):
-                        # 不要在 for 循环中增删循环列表中的元素
-                        outside.append(sprite)
-                        # 更新粒子所处的网格
-                        self.grid[now_row][now_col].append(sprite)
-                # for 循环结束之后删除离开网格的粒子
-                for sprite in outside:
-                    box.remove(sprite)
+        # 只遍历非空网格，遍历过程中 occupied 会被修改，因此先复制一份
+        for (row, col) in list(self.occupied):
+            box = self.grid[row][col]
+            # outside 列表存放离开网格的粒子
+            outside = set()
+            for sprite in box:
+                now_row = int(sprite.position.x / self.size)
+                now_col = int(sprite.position.y / self.size)
+                # 判断粒子是否离开原先的网格
+                if (now_row != row) or (now_col != col):
+                    # 不要在 for 循环中增删循环列表中的元素
+                    outside.add(sprite)
+                    # 更新粒子所处的网格
+                    self.grid[now_row][now_col].append(sprite)
+                    self.occupied.add((now_row, now_col))
+            # for 循环结束之后删除离开网格的粒子
+            if outside:
+                # 原地修改列表，保持 neighbors 中对网格列表的引用有效
+                box[:] = [sprite for sprite in box if sprite not in outside]
+                if not box:
+                    self.occupied.discard((row, col))
 
     def collide(self):
-        # 只需检测右下方向网格中的粒子
-        adjoin = ((1, -1), (1, 0), (1, 1), (0, 1))
-        for row in range(self.Nrow):
-            for col in range(self.Ncol):
-                box = self.grid[row][col]
+        # 只遍历非空网格，耗时与粒子分布有关，而与屏幕面积无关
+        for (row, col) in self.occupied:
+            box = self.grid[row][col]
+            neighbors = self.neighbors[row][col]
 
-                for i, p1 in enumerate(box):
-                    # 检测同一网格中的粒子
-                    for p2 in box[i+1:]:
-                        p1.collide(p2)
+            for i, p1 in enumerate(box):
+                # 检测同一网格中的粒子
+                for p2 in box[i+1:]:
+                    p1.collide(p2)
 
-                    # 检测相邻网格中的粒子
-                    for (drow, dcol) in adjoin:
-                        next_row = row + drow
-                        next_col = col + dcol
-                        # 判断行列坐标是否超出网格上下限
-                        if self.in_grid(next_row, next_col):
-                            next_box = self.grid[next_row][next_col]
-                            for p2 in next_box:
-                                p1.collide(p2)
+                # 检测相邻网格中的粒子，空网格中没有粒子，内层循环直接跳过
+                for next_box in neighbors:
+                    for p2 in next_box:
+                        p1.collide(p2)
 
     def update(self, dt):
         # 更新粒子位置
@@ -0,0 +1,124 @@
+import pygame
+import numpy as np
+
+# 只需检测右下方向网格中的粒子
+adjoin = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+def counting_sort(cells, num_cells):
+    """ 按网格序号对粒子进行计数排序
+
+    counting_sort(cells, num_cells)
+
+    返回 (order, cell_start, cell_count)：
+    order 为按网格序号排列的粒子序号，
+    网格 c 中的粒子为 order[cell_start[c] : cell_start[c] + cell_count[c]]
+
+    """
+
+    cell_count = np.bincount(cells, minlength = num_cells)
+    cell_start = np.cumsum(cell_count) - cell_count
+    # 网格数不超过 65536 时，16 位整数的稳定排序为基数排序，复杂度 O(n)
+    if num_cells <= 1 << 16:
+        cells = cells.astype(np.uint16)
+    order = np.argsort(cells, kind = 'stable')
+
+    return order, cell_start, cell_count
+
+def expand(first, start, count):
+    # 将每个粒子 first[k] 与 order 中 [start[k], start[k] + count[k]) 的粒子依次配对
+    total = count.sum()
+    firsts = np.repeat(first, count)
+    offsets = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+    seconds = np.repeat(start, count) + offsets
+    return firsts, seconds
+
+def candidate_pairs(cells, order, cell_start, cell_count, Nrow, Ncol):
+    """ 生成同一网格及相邻网格中的候选粒子对
+
+    candidate_pairs(cells, order, cell_start, cell_count, Nrow, Ncol)
+
+    返回粒子序号对数组，每对粒子只出现一次
+
+    """
+
+    num = len(order)
+    # rank 为粒子在 order 中的位置
+    rank = np.arange(num)
+    sorted_cells = cells[order]
+    row = sorted_cells // Ncol
+    col = sorted_cells % Ncol
+
+    # 同一网格中的粒子：只与排在自己之后的粒子配对
+    end = cell_start[sorted_cells] + cell_count[sorted_cells]
+    firsts, seconds = expand(rank, rank + 1, end - rank - 1)
+    all_firsts = [firsts]
+    all_seconds = [seconds]
+
+    # 相邻网格中的粒子
+    for (drow, dcol) in adjoin:
+        next_row = row + drow
+        next_col = col + dcol
+        # 判断行列坐标是否超出网格上下限
+        valid = (next_row >= 0) & (next_col >= 0) & (next_row < Nrow) & (next_col < Ncol)
+        next_cells = next_row[valid] * Ncol + next_col[valid]
+        firsts, seconds = expand(rank[valid], cell_start[next_cells], cell_count[next_cells])
+        all_firsts.append(firsts)
+        all_seconds.append(seconds)
+
+    firsts = order[np.concatenate(all_firsts)]
+    seconds = order[np.concatenate(all_seconds)]
+    return np.stack((firsts, seconds), axis = 1)
+
+class SortGridGroup(pygame.sprite.Group):
+
+    """ 基于计数排序的均匀网格群组，可直接替换 GridGroup
+
+    SortGridGroup(box_size)
+
+    每帧根据粒子位置重新计算网格序号并排序，
+    不再为每个网格维护 Python 列表，regrid 的复杂度为 O(n)
+
+    """
+
+    def __init__(self, box_size, *sprites):
+        super().__init__(*sprites)
+
+        self.width, self.height = pygame.display.get_window_size()
+        self.size = box_size
+        # 计算网格行列数
+        self.Nrow = int(self.width  / self.size) + 1
+        self.Ncol = int(self.height / self.size) + 1
+
+        self.particles  = []
+        self.cells      = np.zeros(0, dtype = int)
+        self.order      = np.zeros(0, dtype = int)
+        self.cell_start = np.zeros(self.Nrow * self.Ncol, dtype = int)
+        self.cell_count = np.zeros(self.Nrow * self.Ncol, dtype = int)
+
+    def add2grid(self, sprite):
+        # 网格成员在每次 regrid() 时整体重建，这里只需加入群组
+        self.add(sprite)
+
+    def regrid(self):
+        # 根据粒子的位置计算所处网格的序号
+        self.particles = self.sprites()
+        positions = np.array([(p.position.x, p.position.y) for p in self.particles]).reshape(-1, 2)
+        row = np.clip((positions[:, 0] / self.size).astype(int), 0, self.Nrow - 1)
+        col = np.clip((positions[:, 1] / self.size).astype(int), 0, self.Ncol - 1)
+        self.cells = row * self.Ncol + col
+
+        self.order, self.cell_start, self.cell_count = counting_sort(self.cells, self.Nrow * self.Ncol)
+
+    def collide(self):
+        pairs = candidate_pairs(self.cells, self.order, self.cell_start, self.cell_count, self.Nrow, self.Ncol)
+        for (i, j) in pairs.tolist():
+            self.particles[i].collide(self.particles[j])
+
+    def update(self, dt):
+        # 更新粒子位置
+        for sprite in self.sprites():
+            sprite.update(dt)
+        # 更新粒子所处的网格
+        self.regrid()
+        # 进行碰撞检测和处理
+        self.collide()
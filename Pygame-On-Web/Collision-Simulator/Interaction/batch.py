@@ -0,0 +1,209 @@
+""" 无窗口批量模拟
+
+python batch.py config.json [--output batch] [--steps 10000]
+
+使用 SDL 的 dummy 视频驱动，不打开游戏窗口，不进行绘制，
+由配置文件生成场景，以固定步长反复调用与游戏中相同的物理更新，
+定期保存快照（可在游戏中按 F9 键读取）并记录统计数据。
+
+配置文件为 JSON 格式，未给出的项使用 defaults 中的默认值，例如：
+
+    {"particles": 200000, "world": [8000, 6000], "steps": 10000,
+     "mode": "sortgrid", "snapshot_every": 1000}
+
+输出目录中包含：
+    step_XXXXXXXX.snap  每隔 snapshot_every 步保存的快照
+    stats.csv           每隔 stats_every 步记录的粒子数、动能、动量和耗时
+    summary.json        配置、总步数、总耗时与最终统计数据
+
+按 Ctrl+C 中断时，保存当前步的快照和统计数据后退出。
+
+"""
+
+import os
+# 必须在 pygame 初始化之前指定 dummy 视频驱动
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import csv
+import json
+import random
+import time
+
+import pygame
+
+from game import Game
+from grid import GridGroup
+from sortgrid import SortGridGroup
+from sweep import SweepPrune
+from collision import collide_all
+
+defaults = {'world':          [1200, 800],
+            'particles':      10000,
+            'max_radius':     5,
+            'densities':      [1, 20],
+            'box_size':       None,
+            'elasticity':     0.95,
+            'mode':           'sortgrid',
+            'steps':          1000,
+            'dt':             1 / 120,
+            'seed':           0,
+            'load':           None,
+            'snapshot_every': 1000,
+            'stats_every':    100}
+
+modes = ('sortgrid', 'gridgroup', 'sweep', 'brute')
+
+def build(config):
+    # 与游戏中相同的方式生成粒子，随机数种子固定，保证结果可重复
+    random.seed(config['seed'])
+    world = tuple(config['world'])
+    game = Game(world, world = world)
+    game.store.elasticity = config['elasticity']
+
+    box_size = config['box_size'] or config['max_radius'] * 2
+    particles = pygame.sprite.Group()
+    if config['mode'] == 'gridgroup':
+        grid = GridGroup(box_size, game.store)
+    else:
+        # 指定网格边长时不再自适应调整
+        grid = SortGridGroup(box_size, game.store, adaptive = config['box_size'] is None)
+
+    if config['load']:
+        game.load(config['load'], pygame.Vector2(0, 0), [particles, grid], grid)
+    else:
+        game.generate(config['particles'], config['max_radius'], [particles, grid], grid, config['densities'])
+
+    return game, grid
+
+def stepper(config, game, grid):
+
+    """ 返回单步物理更新函数
+
+    stepper(config, game, grid)
+
+    返回的函数以步长 dt 更新一步，并返回本步检测的粒子对个数
+
+    """
+
+    store = game.store
+    if config['mode'] == 'sweep':
+        sweep = SweepPrune(store)
+        def step(dt):
+            sweep.pair_tests = 0
+            sweep.update(dt)
+            return sweep.pair_tests
+    elif config['mode'] == 'brute':
+        def step(dt):
+            collide_all(store)
+            store.step(dt)
+            return store.num * (store.num - 1) // 2
+    elif config['mode'] == 'gridgroup':
+        def step(dt):
+            grid.update(dt)
+            return 0
+    else:
+        def step(dt):
+            grid.pair_tests = 0
+            grid.update(dt)
+            return grid.pair_tests
+
+    return step
+
+def statistics(store):
+    # 总动能与总动量，弹性系数小于 1 时动能逐渐减少
+    masses = store.masses
+    velocities = store.velocities
+    momentum = (masses[:, None] * velocities).sum(axis = 0)
+    return {'particles':      store.num,
+            'total_mass':     float(masses.sum()),
+            'kinetic_energy': float(0.5 * (masses * (velocities ** 2).sum(axis = 1)).sum()),
+            'momentum_x':     float(momentum[0]),
+            'momentum_y':     float(momentum[1])}
+
+def run(config, output, verbose = True):
+    os.makedirs(output, exist_ok = True)
+    game, grid = build(config)
+    step = stepper(config, game, grid)
+    view = pygame.Vector2(0, 0)
+
+    def save(done):
+        game.save(os.path.join(output, f"step_{done:08d}.snap"), view)
+
+    initial = statistics(game.store)
+    if verbose:
+        print(f"{config['mode']} {initial['particles']} particles, {config['steps']} steps of {config['dt']:.5f} s")
+
+    with open(os.path.join(output, 'stats.csv'), 'w', newline = '') as f:
+        fieldnames = ['step', 'elapsed', 'steps_per_sec', 'pair_tests', *initial.keys()]
+        writer = csv.DictWriter(f, fieldnames = fieldnames)
+        writer.writeheader()
+
+        done = 0
+        pair_tests = 0
+        start = time.perf_counter()
+        last_time, last_done = start, 0
+        try:
+            while done < config['steps']:
+                pair_tests = step(config['dt'])
+                done += 1
+
+                if done % config['stats_every'] == 0 or done == config['steps']:
+                    now = time.perf_counter()
+                    row = {'step':          done,
+                           'elapsed':       now - start,
+                           'steps_per_sec': (done - last_done) / (now - last_time),
+                           'pair_tests':    pair_tests,
+                           **statistics(game.store)}
+                    writer.writerow(row)
+                    f.flush()
+                    if verbose:
+                        print(f"step {done:>8} {row['steps_per_sec']:>9.2f} steps/s  "
+                              f"KE {row['kinetic_energy']:.4g}")
+                    last_time, last_done = now, done
+
+                if config['snapshot_every'] and done % config['snapshot_every'] == 0:
+                    save(done)
+        except KeyboardInterrupt:
+            print(f"interrupted at step {done}")
+        elapsed = time.perf_counter() - start
+
+    # 最后一步总是保存快照，便于继续运行或在游戏中查看
+    if not config['snapshot_every'] or done % config['snapshot_every'] != 0:
+        save(done)
+
+    final = statistics(game.store)
+    summary = {'config':        config,
+               'steps':         done,
+               'elapsed':       elapsed,
+               'steps_per_sec': done / elapsed if elapsed > 0 else 0.0,
+               'ns_per_particle_step': elapsed * 1e9 / (done * final['particles']) if done else 0.0,
+               'initial':       initial,
+               'final':         final}
+    with open(os.path.join(output, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent = 2)
+
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless batch run of the collision simulator physics")
+    parser.add_argument('config', help = "JSON file with the scene and run settings")
+    parser.add_argument('--output', default = 'batch', help = "directory for snapshots and statistics")
+    parser.add_argument('--steps', type = int, help = "override the number of steps in the config")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = {**defaults, **json.load(f)}
+    if args.steps is not None:
+        config['steps'] = args.steps
+    if config['mode'] not in modes:
+        parser.error(f"mode must be one of {', '.join(modes)}")
+
+    summary = run(config, args.output)
+    print(f"{summary['steps']} steps in {summary['elapsed']:.1f} s, "
+          f"{summary['steps_per_sec']:.2f} steps/s, {summary['ns_per_particle_step']:.1f} ns/particle-step")
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+""" 无窗口性能测试
+
+python benchmark.py [--modes sortgrid gridgroup brute parallel] [--counts 100 1000 10000 100000]
+                    [--steps 50] [--dt 0.01] [--seed 0] [--budget 10] [--density 5000]
+                    [--workers 4] [--memory] [--csv result.csv]
+
+使用 SDL 的 dummy 视频驱动，不打开游戏窗口，不经过 clock.tick() 和事件循环，
+以固定随机数种子生成粒子、以固定的 dt 反复调用物理更新，
+统计每秒步数、每个粒子每步耗时（纳秒），指定 --memory 时另外统计峰值内存。
+世界尺寸随粒子数缩放，粒子密度保持为每 1200×800 的面积 density 个粒子，
+不同粒子数的结果可以直接比较。
+parallel 与 sortgrid 相同，但碰撞处理由 ParallelCollider 交给 workers 个进程，
+两者的每秒步数之比即为多进程的加速比。
+
+"""
+
+import os
+# 必须在 pygame 初始化之前指定 dummy 视频驱动
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import csv
+import math
+import random
+import time
+import tracemalloc
+
+import pygame
+
+from game import Game
+from grid import GridGroup
+from sortgrid import SortGridGroup
+from collision import collide_all
+from parallel import ParallelCollider
+
+dims = (1200, 800)
+max_radius = 5
+
+def world_size(num, density):
+    # 面积与粒子数成正比、长宽比与 dims 相同的世界尺寸
+    scale = math.sqrt(num / density)
+    return (max(int(dims[0] * scale), 4 * max_radius), max(int(dims[1] * scale), 4 * max_radius))
+
+def build(mode, num, seed, workers, world):
+    # 与游戏中相同的方式生成粒子，随机数种子固定，保证结果可重复
+    # 返回 (step, close)，close() 释放进程池和共享内存
+    random.seed(seed)
+    game = Game(dims, world = world)
+    pygame.display.set_mode(dims)
+
+    particles = pygame.sprite.Group()
+    if mode == 'gridgroup':
+        grid = GridGroup(max_radius * 2, game.store)
+    else:
+        grid = SortGridGroup(max_radius * 2, game.store)
+    game.generate(num, max_radius, [particles, grid], grid)
+
+    close = lambda: None
+    if mode == 'brute':
+        def step(dt):
+            collide_all(game.store)
+            game.store.step(dt)
+    elif mode == 'parallel':
+        collider = ParallelCollider(grid, workers)
+        def step(dt):
+            game.store.step(dt)
+            grid.regrid()
+            collider.collide()
+        close = collider.close
+    else:
+        step = grid.update
+
+    return step, close
+
+def measure(mode, num, steps, dt, seed, budget, workers, density, memory):
+    world = world_size(num, density)
+    step, close = build(mode, num, seed, workers, world)
+    # 进程池在首次碰撞处理时创建，不计入计时
+    if mode == 'parallel':
+        step(dt)
+
+    # 计时：最多运行 steps 步，超出时间预算 budget 秒后提前结束
+    done = 0
+    start = time.perf_counter_ns()
+    while done < steps:
+        step(dt)
+        done += 1
+        if time.perf_counter_ns() - start > budget * 1e9:
+            break
+    elapsed = time.perf_counter_ns() - start
+    close()
+
+    # 峰值内存：重新生成同样的场景，记录生成和单步更新的内存峰值
+    # tracemalloc 使运行变慢数倍，且不计入时间预算，因此只在指定 --memory 时进行
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        step, close = build(mode, num, seed, workers, world)
+        step(dt)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        close()
+        peak_mb = peak / 2 ** 20
+
+    return {'mode':          mode,
+            'particles':     num,
+            'world':         f"{world[0]}x{world[1]}",
+            'steps':         done,
+            'steps_per_sec': done / (elapsed / 1e9),
+            'ns_per_particle_step': elapsed / (done * num),
+            'peak_mb':       peak_mb}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless benchmark of the collision simulator physics")
+    parser.add_argument('--modes', nargs = '+', default = ['sortgrid', 'gridgroup', 'brute'],
+                        choices = ['sortgrid', 'gridgroup', 'brute', 'parallel'])
+    parser.add_argument('--counts', nargs = '+', type = int, default = [100, 1000, 10000, 100000])
+    parser.add_argument('--steps', type = int, default = 50)
+    parser.add_argument('--dt', type = float, default = 0.01)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--budget', type = float, default = 10.0,
+                        help = "time budget in seconds for each mode and particle count")
+    parser.add_argument('--density', type = float, default = 5000,
+                        help = "particles per 1200x800 area, the world is scaled to keep it constant")
+    parser.add_argument('--brute-limit', type = int, default = 20000,
+                        help = "skip the brute-force mode above this particle count")
+    parser.add_argument('--gridgroup-limit', type = int, default = 20000,
+                        help = "skip the gridgroup mode (Python lists per cell) above this particle count")
+    parser.add_argument('--memory', action = 'store_true',
+                        help = "also measure peak memory with tracemalloc in a separate, untimed pass")
+    parser.add_argument('--workers', type = int, default = 4,
+                        help = "number of worker processes in the parallel mode")
+    parser.add_argument('--csv', help = "also write the results to this CSV file")
+    args = parser.parse_args()
+
+    results = []
+    limits = {'brute': args.brute_limit, 'gridgroup': args.gridgroup_limit}
+    print(f"{'mode':>10} {'particles':>10} {'world':>11} {'steps':>6} {'steps/s':>10} {'ns/particle-step':>17} {'peak MB':>9}")
+    for mode in args.modes:
+        for num in args.counts:
+            if num > limits.get(mode, num):
+                print(f"{mode:>10} {num:>10} skipped, above --{mode}-limit {limits[mode]}")
+                continue
+            result = measure(mode, num, args.steps, args.dt, args.seed, args.budget, args.workers,
+                             args.density, args.memory)
+            results.append(result)
+            peak = '-' if result['peak_mb'] is None else f"{result['peak_mb']:.2f}"
+            print(f"{result['mode']:>10} {result['particles']:>10} {result['world']:>11} {result['steps']:>6} "
+                  f"{result['steps_per_sec']:>10.2f} {result['ns_per_particle_step']:>17.1f} {peak:>9}")
+
+    if args.csv and results:
+        with open(args.csv, 'w', newline = '') as f:
+            writer = csv.DictWriter(f, fieldnames = list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
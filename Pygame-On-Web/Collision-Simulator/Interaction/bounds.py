@@ -0,0 +1,24 @@
+class WorldBounds:
+
+    """ 世界边界类：记录粒子运动范围的尺寸
+
+    WorldBounds(size)
+
+    由 Game 创建并传给 ParticleStore 和网格，物理更新时不再查询窗口尺寸。
+    世界的尺寸可以与窗口不同，例如大于窗口时只显示其中一部分。
+    每次 resize() 都会使 version 加一，使用者比较 version 即可得知边界是否发生变化
+
+    """
+
+    def __init__(self, size):
+        self.width, self.height = size
+        self.version = 0
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def resize(self, size):
+        if tuple(size) != self.size:
+            self.width, self.height = size
+            self.version += 1
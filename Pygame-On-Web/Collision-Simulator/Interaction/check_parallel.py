@@ -0,0 +1,164 @@
+""" 多进程并行碰撞处理与单进程处理的一致性检查
+
+python check_parallel.py [--seeds 1 2 3] [--num 800] [--add 100] [--steps 8] [--workers 4]
+                         [--sparse 150] [--tolerance 1e-9]
+
+1. 条带算法：以固定随机数种子生成两份相同的场景，每步更新位置、重建网格后，分别以
+       ParallelCollider：条带交给进程池中的 workers 个进程处理
+       同样划分条带的 ParallelCollider，但由单个线程依次处理各条带
+   进行碰撞处理，比较每一步之后所有粒子的位置和速度。
+   各条带中的粒子互不相同，处理顺序不影响结果，两者应当完全一致。
+   每步再添加 add 个粒子，使 store 扩容，下一次碰撞处理时重新分配共享内存。
+
+2. 与单进程的 SortGridGroup.collide 比较：在较稀疏的场景（sparse 个粒子）中，
+   每步由相同的状态出发分别进行一次碰撞处理，比较处理后的位置和速度。
+   两者处理粒子对的顺序不同：条带内部的粒子对先于跨越边界的粒子对处理。
+   只有一个粒子同时与多个粒子接触（或可能被推至接触）时，处理顺序才会影响结果，
+   因此将候选距离（半径之和加最大半径）以内相连的粒子分组，
+   不超过 2 个粒子的组的误差须不超过 tolerance；更大的组（簇）单独统计，不作要求。
+
+任何一个种子出现差异、误差超过 tolerance，或共享内存容量没有跟随 store 扩容时以非零状态退出。
+
+"""
+
+import os
+# 必须在 pygame 初始化之前指定 dummy 视频驱动
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame
+
+from game import Game
+from sortgrid import SortGridGroup
+from parallel import ParallelCollider
+from collision import broad_phase
+
+world = (400, 300)
+max_radius = 5
+
+def build(num, seed, workers):
+    random.seed(seed)
+    game = Game(world)
+    pygame.display.set_mode(world)
+
+    particles = pygame.sprite.Group()
+    grid = SortGridGroup(max_radius * 2, game.store)
+    game.generate(num, max_radius, [particles, grid], grid)
+    return game, particles, grid, ParallelCollider(grid, workers)
+
+def check(num, add, steps, dt, seed, workers):
+    parallel = build(num, seed, workers)
+    serial = build(num, seed, workers)
+    # 单线程依次处理各条带，与工作进程执行相同的 collide_strip
+    serial[3].pool = ThreadPoolExecutor(max_workers = 1)
+
+    errors = []
+    grown = True
+    for step in range(steps):
+        for game, particles, grid, collider in (parallel, serial):
+            game.store.step(dt)
+            grid.regrid()
+            collider.collide()
+            # 碰撞处理之后，共享内存容量不小于 store 的容量，store 的数组即为共享内存中的数组
+            if collider is parallel[3]:
+                grown &= collider.capacity >= game.store.capacity and \
+                         game.store.position_array is collider.views['position_array']
+            # 两份场景添加相同的粒子
+            random.seed(seed * 1000 + step)
+            game.generate(add, max_radius, [particles, grid], grid)
+
+        a, b = parallel[0].store, serial[0].store
+        errors.append((float(np.abs(a.positions - b.positions).max()),
+                       float(np.abs(a.velocities - b.velocities).max())))
+
+    for game, particles, grid, collider in (parallel, serial):
+        collider.close()
+    return errors, grown
+
+def clusters(positions, radii):
+    # 候选距离以内相连的粒子组成的组，返回属于 3 个及以上粒子的组的粒子
+    pairs = broad_phase(positions, radii, radii.max() / 2)
+    label = np.arange(len(positions))
+    while True:
+        low = np.minimum(label[pairs[:, 0]], label[pairs[:, 1]])
+        new_label = label.copy()
+        np.minimum.at(new_label, pairs[:, 0], low)
+        np.minimum.at(new_label, pairs[:, 1], low)
+        # 标签传递到组内最小的序号后不再变化
+        new_label = new_label[new_label]
+        if (new_label == label).all():
+            break
+        label = new_label
+    size = np.bincount(label, minlength = len(positions))
+    return size[label] > 2
+
+def check_serial(num, steps, dt, seed, workers):
+    parallel = build(num, seed, workers)
+    serial = build(num, seed, workers)
+
+    errors = []
+    members = 0
+    for step in range(steps):
+        game, particles, grid, collider = serial
+        game.store.step(dt)
+        grid.regrid()
+        # 两种方法由相同的状态出发
+        store = parallel[0].store
+        store.positions[:] = game.store.positions
+        store.velocities[:] = game.store.velocities
+        parallel[2].regrid()
+        in_cluster = clusters(game.store.positions, game.store.radii)
+        members += int(in_cluster.sum())
+
+        grid.collide()
+        parallel[3].collide()
+        alone = ~in_cluster
+        errors.append((float(np.abs(store.positions - game.store.positions)[alone].max()),
+                       float(np.abs(store.velocities - game.store.velocities)[alone].max()),
+                       float(np.abs(store.velocities - game.store.velocities)[in_cluster].max(initial = 0))))
+
+    for game, particles, grid, collider in (parallel, serial):
+        collider.close()
+    return errors, members
+
+def main():
+    parser = argparse.ArgumentParser(description = "Check ParallelCollider against strip-by-strip serial processing")
+    parser.add_argument('--seeds', nargs = '+', type = int, default = [1, 2, 3])
+    parser.add_argument('--num', type = int, default = 800)
+    parser.add_argument('--add', type = int, default = 100)
+    parser.add_argument('--steps', type = int, default = 8)
+    parser.add_argument('--dt', type = float, default = 1 / 120)
+    parser.add_argument('--workers', type = int, default = 4)
+    parser.add_argument('--sparse', type = int, default = 150)
+    parser.add_argument('--tolerance', type = float, default = 1e-9)
+    args = parser.parse_args()
+
+    failed = False
+    for seed in args.seeds:
+        errors, grown = check(args.num, args.add, args.steps, args.dt, seed, args.workers)
+        position_error = max(error[0] for error in errors)
+        velocity_error = max(error[1] for error in errors)
+        ok = position_error == 0 and velocity_error == 0 and grown
+        failed |= not ok
+        print(f"seed {seed}: max |dpos| {position_error:.3e}  max |dv| {velocity_error:.3e}  "
+              f"shared memory {'ok' if grown else 'STALE'}  {'ok' if ok else 'MISMATCH'}")
+
+        errors, members = check_serial(args.sparse, args.steps, args.dt, seed, args.workers)
+        position_error = max(error[0] for error in errors)
+        velocity_error = max(error[1] for error in errors)
+        cluster_error = max(error[2] for error in errors)
+        ok = max(position_error, velocity_error) <= args.tolerance
+        failed |= not ok
+        print(f"seed {seed} vs serial: max |dpos| {position_error:.3e}  max |dv| {velocity_error:.3e}  "
+              f"clusters: {members} particle-steps, max |dv| {cluster_error:.3e}  {'ok' if ok else 'MISMATCH'}")
+
+    pygame.quit()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
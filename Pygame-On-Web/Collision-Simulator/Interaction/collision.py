@@ -0,0 +1,159 @@
+""" 批量碰撞检测与处理模块
+
+broad_phase(positions, radii, margin)
+    找出所有相互重叠的粒子对，返回 (i, j) 序号数组，i < j，按字典序排列，
+    margin 可以是标量或每个粒子的数组，判定时每个粒子的半径放宽 margin
+
+collide_all(store)
+    对所有粒子两两进行碰撞处理，结果与按序号逐对调用 Particle.collide 相同
+
+near_pairs(positions, radii, pairs, margin)
+    从候选粒子对中筛选出距离小于半径之和加 margin 的粒子对
+
+resolve_pairs(store, pairs, moved)
+    对粒子对 pairs 按顺序一次性进行碰撞处理，结果与按相同顺序逐对调用 Particle.collide 相同
+
+"""
+
+import numpy as np
+
+def broad_phase(positions, radii, margin = 0.0, tile = 1 << 16):
+    num = len(positions)
+    if num == 0:
+        return np.zeros((0, 2), dtype = int)
+
+    # 分块计算两两距离，每块最多检测 tile 对粒子，内存占用不随 n² 增长
+    rows = max(1, tile // num)
+    x = positions[:, 0]
+    y = positions[:, 1]
+    # 每个粒子放宽后的半径
+    reach = radii + margin
+    pairs = []
+    for start in range(0, num, rows):
+        stop = min(start + rows, num)
+        # 每对粒子仅检测一次：只与序号不小于 start 的粒子比较
+        dx = x[start:stop, None] - x[None, start:]
+        dy = y[start:stop, None] - y[None, start:]
+        touch = reach[start:stop, None] + reach[None, start:]
+        ii, jj = np.nonzero(dx * dx + dy * dy < touch * touch)
+        # 只保留 j > i 的上三角部分
+        upper = jj > ii
+        pairs.append(np.stack((ii[upper] + start, jj[upper] + start), axis = 1))
+
+    return np.concatenate(pairs)
+
+def collide_all(store):
+    """ 对所有粒子两两进行碰撞处理
+
+    collide_all(store)
+
+    前面的碰撞处理会推开粒子，可能使原本不重叠的粒子对在轮到它时变为重叠。
+    先处理当前重叠的粒子对，并记录每个粒子被推动的总距离；
+    初始距离小于半径之和加上二者被推动距离的粒子对才可能在处理过程中接触，
+    将其加入候选后从初始状态重新处理，直到候选不再增加。
+    不在候选中的粒子对始终不会接触，因此结果与按序号逐对调用 Particle.collide 相同
+
+    """
+
+    positions = store.positions
+    velocities = store.velocities
+    radii = store.radii
+    start_positions = positions.copy()
+    start_velocities = velocities.copy()
+
+    pairs = broad_phase(start_positions, radii)
+    while True:
+        moved = np.zeros(store.num)
+        resolve_pairs(store, pairs, moved)
+
+        # 并集按字典序排列，即逐对处理时的顺序
+        reach = broad_phase(start_positions, radii, moved)
+        candidates = np.unique(np.concatenate((pairs, reach)), axis = 0)
+        if len(candidates) == len(pairs):
+            return pairs
+
+        pairs = candidates
+        positions[:] = start_positions
+        velocities[:] = start_velocities
+
+def near_pairs(positions, radii, pairs, margin = 0.0):
+    # 网格等算法给出的候选粒子对很多，先排除距离较远的粒子对，减少 resolve_pairs 的轮数
+    # 前面的碰撞处理可能将被排除的粒子对推至接触，margin 越大漏检越少
+    if not len(pairs):
+        return pairs
+    separation = positions[pairs[:, 0]] - positions[pairs[:, 1]]
+    reach = radii[pairs[:, 0]] + radii[pairs[:, 1]] + margin
+    return pairs[np.einsum('ij,ij->i', separation, separation) < reach * reach]
+
+def split_rounds(pairs, num):
+    """ 将粒子对划分为若干轮，同一轮中每个粒子最多出现一次
+
+    某个粒子对只有在它之前所有与之共享粒子的粒子对都已处理后才会被选中，
+    因此逐轮处理的结果与按顺序逐对处理完全一致。
+
+    """
+
+    remaining = np.arange(len(pairs))
+    while remaining.size:
+        ends = pairs[remaining].ravel()
+        # 每个粒子在剩余粒子对中第一次出现的位置
+        first = np.full(num, len(ends))
+        np.minimum.at(first, ends, np.arange(len(ends)))
+        # 两个粒子都是第一次出现的粒子对可以在本轮处理
+        slots = np.arange(0, len(ends), 2)
+        selected = (first[ends[0::2]] == slots) & (first[ends[1::2]] == slots + 1)
+        yield remaining[selected]
+        remaining = remaining[~selected]
+
+def resolve_pairs(store, pairs, moved = None):
+    # moved 不为 None 时累加每个粒子被推动的距离
+    pairs = np.asarray(pairs, dtype = int).reshape(-1, 2)
+
+    positions  = store.positions
+    velocities = store.velocities
+    radii  = store.radii
+    masses = store.masses
+
+    for batch in split_rounds(pairs, store.num):
+        i = pairs[batch, 0]
+        j = pairs[batch, 1]
+
+        r1 = positions[i]
+        r2 = positions[j]
+        separation = r1 - r2
+        distance2 = np.einsum('ij,ij->i', separation, separation)
+        distance = np.sqrt(distance2)
+        overlap = radii[i] + radii[j] - distance
+
+        # 重叠且不完全重合的粒子对才需要处理
+        hit = (overlap > 0) & (distance > 0)
+        if not hit.any():
+            continue
+        i, j = i[hit], j[hit]
+        r1, r2 = r1[hit], r2[hit]
+        separation = separation[hit]
+        distance2, distance, overlap = distance2[hit], distance[hit], overlap[hit]
+
+        m1 = masses[i]
+        m2 = masses[j]
+        v1 = velocities[i]
+        v2 = velocities[j]
+
+        # 与 Particle.collide 相同的弹性碰撞公式
+        impulse = np.einsum('ij,ij->i', v1 - v2, separation) / distance2 / (m1 + m2)
+        v1n = v1 - (2 * m2 * impulse)[:, None] * separation
+        v2n = v2 + (2 * m1 * impulse)[:, None] * separation
+
+        velocities[i] = v1n * store.elasticity
+        velocities[j] = v2n * store.elasticity
+
+        # 沿连心线将两个粒子各推开重叠距离的一半
+        push = separation * (0.5 * overlap / distance)[:, None]
+        positions[i] = r1 + push
+        positions[j] = r2 - push
+
+        # 同一轮中每个粒子最多出现一次，可以直接按序号累加
+        if moved is not None:
+            distance = 0.5 * overlap
+            moved[i] += distance
+            moved[j] += distance
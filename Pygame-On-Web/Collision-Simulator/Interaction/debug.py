@@ -1,5 +1,6 @@
 # 引入 pygame 模块
 import pygame
+from collections import OrderedDict
 
 class Debug:
 
@@ -8,14 +9,19 @@ class Debug:
     Debug(screen)
 
     将调试信息输出至游戏界面 screen
+    渲染结果按 (text, color, anchor, line) 缓存，最多保留 cache_size 条，
+    只由数字组成的调试信息（如帧率）由字形图集中的单个字符拼接而成
 
     """
 
-    def __init__(self, screen, padding = 10):
+    # 可由字形图集拼接的字符
+    glyphs = "0123456789.,:-+% "
+
+    def __init__(self, screen, padding = 10, cache_size = 64):
         # 获取游戏界面及其尺寸
         self.screen = screen
         self.width, self.height = screen.get_size()
-        
+
         self.padding = padding
 
         self.map = {
@@ -28,18 +34,68 @@ class Debug:
                 'bottomleft':  (self.padding,              self.height - self.padding),
                 'midbottom':   (self.width / 2,            self.height - self.padding),
                 'bottomright': (self.width - self.padding, self.height - self.padding)}
-        
+
         # 调用 pygame 内置默认字体
         self.font = pygame.font.Font(None, 30)
 
-    def debug(self, info, color = 'white', anchor = 'topleft'):
+        # 最近使用的调试信息渲染结果 (surface, rect)，按使用顺序排列
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        # 每种颜色的字形图集：图集 surface 及每个字符所在的区域
+        self.atlases = {}
+
+    def atlas(self, color):
+        # 每种颜色的字形图集只渲染一次
+        if color not in self.atlases:
+            surfs = [self.font.render(char, True, color, 'black') for char in self.glyphs]
+            height = max(surf.get_height() for surf in surfs)
+            atlas = pygame.Surface((sum(surf.get_width() for surf in surfs), height))
+
+            areas = {}
+            x = 0
+            for char, surf in zip(self.glyphs, surfs):
+                atlas.blit(surf, (x, 0))
+                areas[char] = pygame.Rect(x, 0, surf.get_width(), height)
+                x += surf.get_width()
+            self.atlases[color] = (atlas, areas)
+
+        return self.atlases[color]
+
+    def position(self, anchor, line):
+        # 给定调试信息输出位置
+        x, y = self.map[anchor]
+        if 'bottom' in anchor:
+            y -= line * self.font.get_linesize()
+        else:
+            y += line * self.font.get_linesize()
+        return x, y
+
+    def render(self, text, color, anchor, line):
+        # 命中缓存时将其移至末尾，缓存已满时丢弃最久未使用的一条
+        key = (text, color, anchor, line)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            # 直接渲染黑色背景的文字以覆盖游戏界面中的其他元素，无需每次绘制黑色矩形
+            debug_surf = self.font.render(text, True, color, 'black')
+            debug_rect = debug_surf.get_rect(**{anchor: self.position(anchor, line)})
+            self.cache[key] = (debug_surf, debug_rect)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last = False)
+
+        return self.cache[key]
+
+    def debug(self, info, color = 'white', anchor = 'topleft', line = 0):
 
         """ debug 函数
 
-        debug(info, color = 'white', anchor = 'topleft')
+        debug(info, color = 'white', anchor = 'topleft', line = 0)
 
         将调试信息 info，以字符串格式输出至游戏界面
         可以自定义字体颜色 color 和输出位置 anchor
+        line 为行号，用于在同一位置输出多行信息：
+        底部的位置向上排列，其余位置向下排列
+        返回调试信息在游戏界面中所占的矩形区域
 
         可选的 anchor 位置有：
         'topleft',    'midtop',    'topright',
@@ -48,12 +104,27 @@ class Debug:
 
         """
 
-        # 渲染调试信息
-        debug_surf = self.font.render(str(info), True, color)
-        # 给定调试信息输出位置
-        anchor_pos = {anchor: self.map[anchor]}
-        debug_rect = debug_surf.get_rect(**anchor_pos)
-        # 将调试信息背景设置为黑色，以覆盖游戏界面中的其他元素
-        pygame.draw.rect(self.screen, 'black', debug_rect)
-        # 将调试信息输出至游戏界面
-        self.screen.blit(debug_surf, debug_rect)
+        text = str(info)
+        # pygame.Color 不能作为字典的键
+        if not isinstance(color, str):
+            color = tuple(color)
+
+        if text and set(text) <= set(self.glyphs):
+            # 由字形图集中的字符拼接，数字每帧变化也无需重新渲染
+            atlas, areas = self.atlas(color)
+            debug_rect = pygame.Rect(0, 0, sum(areas[char].width for char in text), atlas.get_height())
+            setattr(debug_rect, anchor, self.position(anchor, line))
+
+            # 将调试信息逐个字符输出至游戏界面
+            blits = []
+            x = debug_rect.x
+            for char in text:
+                blits.append((atlas, (x, debug_rect.y), areas[char]))
+                x += areas[char].width
+            self.screen.blits(blits, doreturn = False)
+        else:
+            debug_surf, debug_rect = self.render(text, color, anchor, line)
+            # 将调试信息输出至游戏界面
+            self.screen.blit(debug_surf, debug_rect)
+
+        return debug_rect
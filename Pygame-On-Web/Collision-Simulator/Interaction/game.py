@@ -8,58 +8,178 @@ import math
 # 引入 debug 模块，方便在游戏界面上输出调试信息
 from debug import Debug
 from particle import Particle
-from grid import GridGroup
+from store import ParticleStore
+from bounds import WorldBounds
+import snapshot
+from recorder import Recorder, Trajectory
+from timestep import FixedTimestep
+from sortgrid import SortGridGroup
+from parallel import ParallelCollider
+from sweep import SweepPrune
+from profiler import Profiler
+from renderer import DirtyRenderer
+from collision import collide_all
 from ui import UIGroup, Button, Switch
 
 class Game:
 
     """Game 类承载游戏主循环
 
-    Game(dims, FPS)
+    Game(dims, FPS, world)
 
     定义游戏界面的尺寸 dims，游戏帧数 FPS，控制游戏流程
+    world 为粒子运动的世界尺寸，默认与游戏界面相同并随窗口缩放，
+    指定时世界尺寸固定，可以大于游戏界面，用方向键移动视野
 
     """
 
-    def __init__(self, dims, FPS = 60):
+    def __init__(self, dims, FPS = 60, world = None):
         self.dims = dims
         self.FPS  = FPS
+        self.world = world
+        # 快照文件的路径
+        self.snapshot_path = 'collision.snap'
+        # 轨迹文件的路径，记录每一步物理更新后的粒子状态
+        self.trajectory_path = 'collision.traj'
+        self.trajectory_fields = {'positions':  ('<f4', 2),
+                                  'velocities': ('<f4', 2),
+                                  'radii':      ('<f4', 1),
+                                  'densities':  ('<f4', 1)}
+
+        # 世界边界，物理更新时不再查询窗口尺寸
+        self.bounds = WorldBounds(world or dims)
+        # 所有粒子的物理状态统一存放在 store 中
+        self.store = ParticleStore(self.bounds)
+        # 物理更新使用固定步长，每帧最多更新 max_steps 步
+        self.timestep = FixedTimestep(1 / 120, 8)
 
         # 初始化pygame，预定义各种常量
         pygame.init()
 
-    def generate(self, num, max_radius, groups, grid):
+    def generate(self, num, max_radius, groups, grid, densities = (1, 20)):
 
         """ 生成 num 个随机粒子
 
         generate(groups)
 
-        生成粒子的 位置、速度、半径、密度均随机。
+        生成粒子的 位置、速度、半径、密度均随机，密度在 densities 范围内。
 
         """
 
         for i in range(num):
             radius = random.randint(2, max_radius)
-            x = random.randint(radius, self.dims[0] - radius)
-            y = random.randint(radius, self.dims[1] - radius)
+            x = random.randint(radius, int(self.bounds.width)  - radius)
+            y = random.randint(radius, int(self.bounds.height) - radius)
 
             speed = random.randint(100, 200)
             # 速度方向随机
             angle = random.random() * 2.0 * math.pi
             velocity = (speed * math.cos(angle), speed * math.sin(angle))
 
-            density = random.randint(1, 20)
+            density = random.randint(*densities)
 
-            grid.add2grid(Particle((x, y), velocity, radius, density, groups))
+            grid.add2grid(Particle((x, y), velocity, radius, density, self.store, groups))
+
+    def save(self, path, view):
+
+        """ 将所有粒子的状态、世界尺寸和视野位置保存为快照文件
+
+        save(path, view)
+
+        """
+
+        meta = {'simulator':  'collision',
+                'world':      list(self.bounds.size),
+                'view':       [view.x, view.y],
+                'elasticity': self.store.elasticity}
+        snapshot.save(path, self.store.state(), meta)
+
+    def load(self, path, view, groups, grid):
+
+        """ 由快照文件恢复模拟状态
+
+        load(path, view, groups, grid)
+
+        原有粒子全部丢弃，由快照中的数组重新生成粒子
+
+        """
+
+        arrays, meta = snapshot.load(path)
+        if meta.get('simulator') != 'collision':
+            raise ValueError(f"{path} is not a collision simulator snapshot")
+        # 先检查快照是否完整，再丢弃原有粒子，读取失败时模拟状态不变
+        snapshot.validate(path, arrays, meta, ('world', 'view', 'elasticity'),
+                          {'radii': 1, 'positions': 2, 'velocities': 2, 'densities': 1, 'previous': 2})
+        if len(meta['world']) != 2 or len(meta['view']) != 2:
+            raise ValueError(f"{path} has an invalid world size or view")
+
+        for group in groups:
+            group.empty()
+        self.bounds.resize(meta['world'])
+        view.update(meta['view'])
+        self.store.restore(arrays, meta['elasticity'])
+
+        # 半径和密度在生成时均为整数
+        radii = self.store.radii.astype(int).tolist()
+        densities = self.store.densities.astype(int).tolist()
+        for index in range(self.store.num):
+            grid.add2grid(Particle(None, None, radii[index], densities[index], self.store, groups, index))
+
+    def record(self):
+
+        """ 开始记录轨迹
+
+        record()
+
+        返回 Recorder，每一步物理更新后调用 recorder.record() 记录一帧
+
+        """
+
+        meta = {'simulator':  'collision',
+                'world':      list(self.bounds.size),
+                'step':       self.timestep.step,
+                'elasticity': self.store.elasticity}
+        return Recorder(self.trajectory_path, self.trajectory_fields, meta)
+
+    def replay(self, arrays, store, groups):
+
+        """ 将轨迹中的一帧写入回放使用的 store
+
+        replay(arrays, store, groups)
+
+        回放时不进行物理更新，只替换粒子位置，粒子个数变化时重新生成粒子
+
+        """
+
+        positions = arrays['positions']
+        if len(positions) != store.num:
+            for group in groups:
+                group.empty()
+            store.restore(dict(arrays, previous = positions), store.elasticity)
+
+            radii = store.radii.astype(int).tolist()
+            densities = store.densities.astype(int).tolist()
+            for index in range(store.num):
+                Particle(None, None, radii[index], densities[index], store, groups, index)
+        else:
+            store.positions[:] = positions
+            store.render_positions[:] = positions
 
     # 游戏主循环所在函数需要由 async 定义
     async def start(self):
         # 初始化游戏界面（screen）：尺寸、背景色等
-        screen = pygame.display.set_mode(self.dims)
-        screen_width, screen_height = self.dims
+        # 窗口可以缩放
+        screen = pygame.display.set_mode(self.dims, pygame.RESIZABLE)
         screen_color = 'Black'
+        # 视野左上角在世界中的位置，方向键移动视野的速度
+        view = pygame.Vector2(0, 0)
+        view_speed = 600
 
         debug = Debug(screen, 10)
+        # 只擦除和刷新发生变化的区域，按 R 键切换为每帧刷新整个界面
+        renderer = DirtyRenderer(screen, screen_color)
+        # 按 F3 键显示各阶段耗时，未启用时几乎没有额外开销
+        profiler = Profiler()
 
         # 初始化游戏时钟（clock），由于控制游戏帧率
         clock = pygame.time.Clock()
@@ -67,12 +187,34 @@ class Game:
         max_radius = 5
 
         particles = pygame.sprite.Group()
-        grid = GridGroup(max_radius * 2)
+        # 使用基于计数排序的网格，每帧 O(n) 重建网格成员
+        grid = SortGridGroup(max_radius * 2, self.store)
         self.generate(1, max_radius, [particles, grid], grid)
+        # 多进程并行碰撞检测，首次启用时才创建进程池
+        parallel = ParallelCollider(grid)
+        # 扫描裁剪算法，可与网格算法切换对比
+        sweep = SweepPrune(self.store)
+
+        # 按 F7 键开始或停止记录轨迹，记录在后台线程中压缩写入
+        recorder = None
+        # 按 F8 键回放轨迹，回放时不进行物理更新，粒子存放在单独的 store 中
+        trajectory = None
+        replay_frame = 0
+        replay_store = ParticleStore(self.bounds)
+        replay_particles = pygame.sprite.Group()
+        # 回放时按 PageUp、PageDown 键后退或前进 1 秒，按 Home 键回到开头
+        seek_steps = round(1 / self.timestep.step)
+
+        # 读取快照或轨迹失败时，在界面中央显示错误信息 message_time 毫秒
+        message = None
+        message_until = 0
+        message_time = 3000
 
         uis = UIGroup()
         button_plus = Button("+100", (650, 4), self.generate, 'P', uis)
         switch_grid = Switch("Gridding", (1050, 6), 'G', uis)
+        switch_parallel = Switch("Parallel", (875, 6), 'M', uis)
+        switch_sweep = Switch("Sweep", (745, 6), 'S', uis)
         mouse_pos = pygame.mouse.get_pos()
 
         # 游戏运行控制变量（gamen_running）
@@ -80,78 +222,229 @@ class Game:
         # False：游戏结束
         game_running = True
         switch_grid.is_on = False
+        switch_parallel.is_on = False
+        switch_sweep.is_on = False
         # 游戏主循环
         while game_running:
             # 按照给定的 FPS 刷新游戏
             # clock.tick() 函数返回上一次调用该函数后经历的时间，单位为毫秒 ms
             # dt 记录上一帧接受之后经历的时间，单位为秒 m
-            # 使用 dt 控制物体运动可以使游戏物理过程与帧率无关
+            # dt 交给 self.timestep 累积，物理过程以固定步长进行，与帧率无关
             dt = clock.tick(self.FPS) / 1000.0
             pygame.display.set_caption(f"Collision Simulation [FPS={clock.get_fps():.1f}]")
             # 使用 asyncio 同步
             # 此外游戏主体代码中不需要再考虑 asyncio
             await asyncio.sleep(0)
+            profiler.start()
 
             # 游戏事件处理
             # 包括键盘、鼠标输入等
+            # 回放时不能添加粒子
+            button_plus.is_available = trajectory is None
             for event in pygame.event.get():
                 # 点击关闭窗口按钮或关闭网页
                 if event.type == pygame.QUIT:
                     game_running = False
                 elif event.type == pygame.KEYDOWN:
-                    # 按 P 键添加随机粒子
+                    # 按 P 键添加随机粒子，回放时不添加
                     if event.key == pygame.K_p:
-                        self.generate(100, max_radius, [particles, grid], grid)
+                        if trajectory is None:
+                            self.generate(100, max_radius, [particles, grid], grid)
                     # 按 G 键切换碰撞检测算法
                     if event.key == pygame.K_g:
                         switch_grid.switch()
+                    # 按 M 键切换多进程并行碰撞检测
+                    if event.key == pygame.K_m:
+                        switch_parallel.switch()
+                    # 按 S 键切换扫描裁剪算法
+                    if event.key == pygame.K_s:
+                        switch_sweep.switch()
+                    # 按 F3 键显示或隐藏耗时分析
+                    if event.key == pygame.K_F3:
+                        profiler.toggle()
+                    # 按 R 键切换脏矩形渲染
+                    if event.key == pygame.K_r:
+                        renderer.toggle()
+                    # 按 F5 键保存快照，按 F9 键由快照恢复
+                    if event.key == pygame.K_F5:
+                        self.save(self.snapshot_path, view)
+                    if event.key == pygame.K_F9:
+                        try:
+                            self.load(self.snapshot_path, view, [particles, grid], grid)
+                        except (OSError, ValueError, KeyError) as error:
+                            message = str(error)
+                            message_until = pygame.time.get_ticks() + message_time
+                        else:
+                            renderer.reset()
+                            sweep.reset()
+                    # 按 F7 键开始或停止记录轨迹
+                    if event.key == pygame.K_F7:
+                        if recorder is None:
+                            recorder = self.record()
+                        else:
+                            recorder.close()
+                            recorder = None
+                    # 按 F8 键进入或退出回放模式，进入回放前先结束记录
+                    if event.key == pygame.K_F8:
+                        if trajectory is None:
+                            if recorder is not None:
+                                recorder.close()
+                                recorder = None
+                            try:
+                                trajectory = Trajectory(self.trajectory_path)
+                            except (OSError, ValueError, KeyError) as error:
+                                message = str(error)
+                                message_until = pygame.time.get_ticks() + message_time
+                            else:
+                                if trajectory.frames == 0:
+                                    trajectory.close()
+                                    trajectory = None
+                                replay_frame = 0
+                        else:
+                            trajectory.close()
+                            trajectory = None
+                        replay_store.num = 0
+                        replay_particles.empty()
+                        renderer.reset()
+                    if trajectory is not None:
+                        if event.key == pygame.K_PAGEUP:
+                            replay_frame = max(replay_frame - seek_steps, 0)
+                        if event.key == pygame.K_PAGEDOWN:
+                            replay_frame = min(replay_frame + seek_steps, trajectory.frames - 1)
+                        if event.key == pygame.K_HOME:
+                            replay_frame = 0
+                elif event.type == pygame.VIDEORESIZE:
+                    # 窗口尺寸变化后重新获取游戏界面，世界未指定尺寸时随窗口缩放
+                    screen = pygame.display.get_surface()
+                    if self.world is None:
+                        self.bounds.resize(screen.get_size())
+                    debug = Debug(screen, 10)
+                    renderer.resize(screen)
                 elif event.type == pygame.MOUSEMOTION:
                     # 当鼠标移动时更新鼠标所在位置
                     mouse_pos = event.pos
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     uis.on_click(event.pos, 100, max_radius, [particles, grid], grid)
 
-            # 以背景色覆盖刷新游戏界面
-            screen.fill(screen_color)
+            # 世界大于游戏界面时，按方向键移动视野
+            pressed_keys = pygame.key.get_pressed()
+            view.x += (pressed_keys[pygame.K_RIGHT] - pressed_keys[pygame.K_LEFT]) * view_speed * dt
+            view.y += (pressed_keys[pygame.K_DOWN]  - pressed_keys[pygame.K_UP])   * view_speed * dt
+            view.x = max(0, min(view.x, self.bounds.width  - screen.get_width()))
+            view.y = max(0, min(view.y, self.bounds.height - screen.get_height()))
+
+            # 以背景色擦除上一帧绘制过的区域
+            renderer.clear()
             
             list_particles = particles.sprites()
             total_num = len(list_particles)
-            # 当粒子总数超过 801 时，启用网格算法，禁用算法切换功能
-            if total_num > 801:
+            # 启用扫描裁剪算法时不使用网格算法
+            # 否则当粒子总数超过 2001 时，启用网格算法，禁用算法切换功能
+            if switch_sweep.is_on:
+                switch_grid.is_available = False
+            elif total_num > 2001:
                 switch_grid.is_on = True
                 switch_grid.is_available = False
             else:
                 switch_grid.is_available = True
-
-            if switch_grid.is_on:
-                # 调用 GridGroup 类的 update() 函数，更新粒子状态
-                grid.update(dt)
-                # 调用 GridGroup 类的 draw() 函数，绘制粒子
-                grid.draw(screen)
+            profiler.mark('events')
+
+            # 将本帧经历的时间 dt 换算为若干个固定步长的物理更新
+            steps = self.timestep.advance(dt)
+            if trajectory is not None:
+                # 回放模式：每一步前进一帧，到达结尾后从头循环，由轨迹中的任意一帧直接得到粒子位置
+                replay_frame = (replay_frame + steps) % trajectory.frames
+                self.replay(trajectory.frame(replay_frame), replay_store, [replay_particles])
+                steps = 0
+                profiler.mark('replay')
+
+            # 显示的候选粒子对个数为本帧所有物理更新之和，没有物理更新的帧保留上一帧的数值
+            if steps:
+                grid.pair_tests = 0
+                sweep.pair_tests = 0
+            for i in range(steps):
+                if switch_sweep.is_on or switch_grid.is_on:
+                    # 一次性更新所有粒子位置
+                    self.store.step(self.timestep.step)
+                    profiler.mark('update')
+
+                    if switch_sweep.is_on:
+                        # 扫描裁剪算法：排序后检测 x 区间相交的粒子对
+                        sweep.collide()
+                    else:
+                        # 更新粒子所处的网格
+                        grid.regrid()
+                        profiler.mark('regrid')
+                        # 由多个进程分条带处理碰撞，或在本进程中处理
+                        if switch_parallel.is_on:
+                            parallel.collide()
+                        else:
+                            grid.collide()
+                    profiler.mark('collide')
+                else:
+                    # 每对粒子都进行碰撞检测，一次性处理所有相互重叠的粒子对
+                    collide_all(self.store)
+                    profiler.mark('collide')
+
+                    # 一次性更新所有粒子状态
+                    self.store.step(self.timestep.step)
+                    profiler.mark('update')
+
+                # 主线程中只复制数组，压缩和写入由后台线程完成
+                if recorder is not None:
+                    recorder.record(self.store.state())
+                    profiler.mark('record')
+
+            # 在前后两步之间插值，得到绘制时的粒子位置
+            # 由位置数组一次性绘制所有粒子，并记录绘制过的区域
+            if trajectory is not None:
+                renderer.draw_particles(replay_store, replay_particles, view)
             else:
-                # 每对粒子都进行碰撞检测
-                for i, p1 in enumerate(list_particles):
-                    # 每对粒子仅进行一次碰撞检测
-                    for p2 in list_particles[i+1:]:
-                        p1.collide(p2)
-
-                # 调用 Group 类的 update() 函数，更新粒子状态
-                particles.update(dt)
-                # 调用 Group 类的 draw() 函数，绘制粒子
-                particles.draw(screen)
+                self.store.interpolate(self.timestep.alpha)
+                renderer.draw_particles(self.store, particles, view)
+            profiler.mark('draw')
 
             # 根据鼠标位置和键盘按键信息更新组件的外观渲染
-            uis.update(mouse_pos, pygame.key.get_pressed())
-            uis.draw(screen)
+            uis.update(mouse_pos, pressed_keys)
+            renderer.draw(uis)
+            profiler.mark('ui')
 
             # 调用 debug 函数在游戏界面上方中间显示粒子个数
-            debug.debug(total_num, 'white', 'midtop')
+            renderer.add(debug.debug(total_num, 'white', 'midtop'))
             # 调用 debug 函数在游戏界面左上角显示游戏帧率
-            debug.debug(f"{clock.get_fps():.1f}", 'green')
-
-            # 将游戏界面内容输出至屏幕
-            pygame.display.update()
+            renderer.add(debug.debug(f"{clock.get_fps():.1f}", 'green'))
+            # 在左下角显示网格边长与每帧候选粒子对个数，不使用网格时每对粒子都要检测
+            if switch_sweep.is_on:
+                renderer.add(debug.debug(f"sweep pair tests {sweep.pair_tests}", 'white', 'bottomleft'))
+            elif switch_grid.is_on:
+                renderer.add(debug.debug(f"cell {grid.size:.1f} pair tests {grid.pair_tests}", 'white', 'bottomleft'))
+            else:
+                renderer.add(debug.debug(f"pair tests {total_num * (total_num - 1) // 2}", 'white', 'bottomleft'))
+            # 在右下角显示记录或回放的进度
+            if trajectory is not None:
+                renderer.add(debug.debug(f"replay {replay_frame}/{trajectory.frames}", 'yellow', 'bottomright'))
+            elif recorder is not None:
+                renderer.add(debug.debug(f"rec {recorder.frames} dropped {recorder.dropped}", 'red', 'bottomright'))
+            # 每帧的物理更新步数超过上限时丢弃的模拟时间，此时模拟比实际时间慢
+            if self.timestep.dropped > 0:
+                renderer.add(debug.debug(f"dropped {self.timestep.dropped:.1f}s", 'red', 'midbottom'))
+            # 在界面中央显示读取失败的原因
+            if message is not None and pygame.time.get_ticks() < message_until:
+                renderer.add(debug.debug(message, 'red', 'center'))
+            # 在左侧显示上一帧为止各阶段耗时的分位数，FPS 为 0（不限帧率）时以 60 帧为参照
+            renderer.add(*profiler.draw(debug, 1000 / (self.FPS or 60)))
+            profiler.mark('debug')
+
+            # 将游戏界面中发生变化的区域输出至屏幕
+            renderer.update()
+            profiler.mark('display')
+            profiler.end()
 
         # 当 game_running 为 False 时，
         # 跳出游戏主循环，退出游戏
+        if recorder is not None:
+            recorder.close()
+        if trajectory is not None:
+            trajectory.close()
+        parallel.close()
         pygame.quit()
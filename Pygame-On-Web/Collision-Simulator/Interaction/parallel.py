@@ -0,0 +1,192 @@
+""" 多进程并行网格碰撞检测
+
+ParallelCollider(grid, workers)
+
+将 SortGridGroup 的网格按行（即 x 方向）划分为若干竖直条带，
+每个条带交给进程池中的一个进程，在共享内存中的粒子数组上独立处理条带内部的碰撞，
+跨越条带边界的粒子对最后在主进程中统一处理。
+启用后 ParticleStore 的位置、速度、半径、质量数组直接存放在共享内存中，每步无需复制。
+
+"""
+
+import os
+from concurrent.futures import wait
+# 浏览器（pygbag/emscripten）等环境中没有多进程与共享内存模块，collide() 改为单进程处理
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+except ImportError:
+    ProcessPoolExecutor = None
+    shared_memory = None
+
+import numpy as np
+
+from sortgrid import counting_sort, candidate_pairs
+from collision import near_pairs, resolve_pairs
+
+# 共享内存中存放的数组：名称、每个粒子的列数
+fields = (('positions', 2), ('velocities', 2), ('radii', 1), ('masses', 1), ('cells', 1))
+# 由 ParticleStore 直接使用的共享内存数组：名称、store 中的数组名
+store_arrays = {'positions':  'position_array',
+                'velocities': 'velocity_array',
+                'radii':      'radius_array',
+                'masses':     'mass_array'}
+
+def shared_array(block, name, width):
+    # 共享内存块的数组视图，块的大小可能按内存页向上取整
+    capacity = block.size // (8 * width)
+    shape = (capacity, width) if width > 1 else (capacity,)
+    dtype = np.int64 if name == 'cells' else np.float64
+    return np.ndarray(shape, dtype = dtype, buffer = block.buf)
+
+class SharedStore:
+
+    """ 与 ParticleStore 接口相同的共享内存数组视图，供 resolve_pairs 使用 """
+
+    def __init__(self, blocks, num, elasticity):
+        self.num = num
+        self.elasticity = elasticity
+        for name, width in fields:
+            setattr(self, name, shared_array(blocks[name], name, width)[:num])
+
+# 工作进程中已经连接的共享内存，按名称缓存，避免每帧重新连接
+attached = {}
+
+def attach(names):
+    if attached.get('names') != names:
+        for block in attached.get('blocks', {}).values():
+            block.close()
+        attached['names'] = names
+        attached['blocks'] = {name: shared_memory.SharedMemory(name = block_name)
+                              for (name, _), block_name in zip(fields, names)}
+    return attached['blocks']
+
+def collide_strip(names, num, elasticity, lo, hi, Ncol):
+    # 工作进程：处理第 lo 行至第 hi - 1 行网格中的碰撞
+    store = SharedStore(attach(names), num, elasticity)
+
+    row = store.cells // Ncol
+    members = np.nonzero((row >= lo) & (row < hi))[0]
+    if not members.size:
+        return 0
+
+    # 在条带内部重新编号网格，只生成两个粒子都在条带内的粒子对
+    cells = store.cells[members] - lo * Ncol
+    order, cell_start, cell_count = counting_sort(cells, (hi - lo) * Ncol)
+    pairs = candidate_pairs(cells, order, cell_start, cell_count, hi - lo, Ncol)
+    # 与 SortGridGroup.collide 相同，只处理距离在最大半径以内的粒子对
+    resolve_pairs(store, near_pairs(store.positions, store.radii, members[pairs], store.radii.max()))
+
+    return len(pairs)
+
+def boundary_pairs(grid, edge):
+    """ 生成跨越第 edge - 1 行与第 edge 行之间边界的候选粒子对
+
+    boundary_pairs(grid, edge)
+
+    候选粒子对只出现在同一行或相邻两行的网格之间，因此跨越条带边界的粒子对
+    只需由边界两侧的两行网格生成，返回网格成员（grid.members）中的序号对
+
+    """
+
+    Ncol = grid.Ncol
+    first = (edge - 1) * Ncol
+    # order 按网格序号排列，两行网格中的粒子在 order 中连续存放
+    start = grid.cell_start[first]
+    stop = start + grid.cell_count[first:first + 2 * Ncol].sum()
+    rows = grid.order[start:stop]
+
+    cells = grid.cells[rows] - first
+    pairs = candidate_pairs(cells, np.arange(len(rows)), grid.cell_start[first:first + 2 * Ncol] - start,
+                            grid.cell_count[first:first + 2 * Ncol], 2, Ncol)
+    # 去掉两个粒子在同一行中的粒子对，它们由所在条带的工作进程处理
+    pairs = pairs[cells[pairs[:, 0]] // Ncol != cells[pairs[:, 1]] // Ncol]
+    return rows[pairs]
+
+class ParallelCollider:
+    def __init__(self, grid, workers = None):
+        self.grid = grid
+        self.store = grid.store
+        self.workers = workers or os.cpu_count() or 1
+
+        self.pool = None
+        self.blocks = {}
+        self.capacity = 0
+        # store 中正在使用的共享内存数组
+        self.views = {}
+        self.shared = None
+
+    def start(self):
+        # 浏览器等不支持多进程的环境中返回 False
+        if ProcessPoolExecutor is None or shared_memory is None:
+            return False
+        if self.pool is None:
+            try:
+                self.pool = ProcessPoolExecutor(max_workers = self.workers)
+            except (OSError, NotImplementedError, ImportError):
+                return False
+        return True
+
+    def share(self):
+        store = self.store
+        # 首次启用，或 store 扩容、由快照恢复而重新分配数组后，重新分配共享内存
+        if not self.views or store.position_array is not self.views['position_array']:
+            # release() 会将容量清零，先记录原有容量，保证容量翻倍
+            capacity = max(2 * self.capacity, store.capacity, 1024)
+            self.release()
+            self.capacity = capacity
+            for name, width in fields:
+                self.blocks[name] = shared_memory.SharedMemory(create = True, size = capacity * width * 8)
+            # store 此后直接在共享内存中更新粒子状态
+            self.views = {store_arrays[name]: shared_array(self.blocks[name], name, width)[:capacity]
+                          for name, width in fields if name in store_arrays}
+            store.attach(self.views)
+        self.shared = SharedStore(self.blocks, store.num, store.elasticity)
+
+        # 只有网格序号需要每步复制，不在网格中的大粒子网格序号记为 -1，不属于任何条带
+        self.shared.cells[:] = -1
+        self.shared.cells[self.grid.members] = self.grid.cells
+
+    def collide(self):
+        grid = self.grid
+        if self.store.num == 0:
+            return
+        if not self.start():
+            grid.collide()
+            return
+
+        self.share()
+        names = tuple(self.blocks[name].name for name, _ in fields)
+
+        # 按行将网格划分为条带，每个工作进程处理一个条带
+        bounds = np.linspace(0, grid.Nrow, min(self.workers, grid.Nrow) + 1).astype(int)
+        futures = [self.pool.submit(collide_strip, names, self.store.num, self.store.elasticity, lo, hi, grid.Ncol)
+                   for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+        wait(futures)
+        pair_tests = sum(future.result() for future in futures)
+
+        # 跨越条带边界的粒子对：只由每条边界两侧的两行网格生成，不再重复生成整个网格的粒子对
+        pairs = [grid.members[boundary_pairs(grid, edge)] for edge in bounds[1:-1].tolist()]
+        pairs = np.concatenate((*pairs, grid.outlier_pairs()))
+        grid.pair_tests += pair_tests + len(pairs)
+        radii = self.store.radii
+        resolve_pairs(self.store, near_pairs(self.store.positions, radii, pairs, radii.max()))
+
+    def release(self):
+        # store 仍在使用共享内存时，先将粒子状态复制到普通数组中
+        if self.views and self.store.position_array is self.views['position_array']:
+            self.store.attach({array_name: np.zeros_like(view) for array_name, view in self.views.items()})
+        # 关闭共享内存之前不能再有指向它的数组视图
+        self.views = {}
+        self.shared = None
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+        self.capacity = 0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.release()
@@ -0,0 +1,147 @@
+""" 参数扫描
+
+python paramsweep.py sweep.json [--csv sweep.csv] [--output sweep] [--workers 4]
+
+对参数网格中的每一种组合，在进程池中分别调用 batch.run() 进行无窗口模拟，
+将运行速度与动能漂移汇总为一张 CSV 表格。
+粒子与墙壁反弹时动量不守恒，因此不统计动量漂移；
+elasticity 为 1 时动能守恒，kinetic_energy_drift（动能的相对变化）反映数值误差，
+小于 1 时为碰撞损失的动能比例。
+
+扫描文件为 JSON 格式，base 为所有组合共用的 batch 配置，grid 为每个参数的取值列表，
+参数名须为 batch.defaults 中的配置项，例如：
+
+    {"base": {"steps": 2000, "stats_every": 500},
+     "grid": {"elasticity": [0.9, 0.95, 1.0], "particles": [1000, 10000],
+              "densities": [[1, 20], [5, 10]]}}
+
+每种组合以其完整配置的哈希值 key 标识，每完成一种组合即追加一行结果。
+中断后再次运行时，CSV 中已有的组合直接跳过，只运行其余组合。
+每种组合的快照和统计数据保存在 output/key 目录中。
+
+"""
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import batch
+
+metrics = ['steps', 'elapsed', 'steps_per_sec', 'ns_per_particle_step', 'particles',
+           'kinetic_energy_initial', 'kinetic_energy_final', 'kinetic_energy_drift']
+
+def combinations(base, grid):
+    # 参数网格的笛卡尔积，返回每种组合的参数及其完整配置
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        yield params, {**batch.defaults, **base, **params}
+
+def config_key(config):
+    # 完整配置相同的组合 key 相同，修改 base 后所有组合都会重新运行
+    return hashlib.sha1(json.dumps(config, sort_keys = True).encode('utf-8')).hexdigest()[:12]
+
+def measure(config, output):
+
+    """ 运行一种参数组合，返回其运行速度与物理量
+
+    measure(config, output)
+
+    在子进程中调用，未运行完 config['steps'] 步（被中断）时返回 None
+
+    """
+
+    summary = batch.run(config, output, verbose = False)
+    if summary['steps'] < config['steps']:
+        return None
+
+    initial, final = summary['initial'], summary['final']
+    energy = initial['kinetic_energy']
+    return {'steps':                  summary['steps'],
+            'elapsed':                summary['elapsed'],
+            'steps_per_sec':          summary['steps_per_sec'],
+            'ns_per_particle_step':   summary['elapsed'] * 1e9 / (summary['steps'] * initial['particles']),
+            'particles':              initial['particles'],
+            'kinetic_energy_initial': energy,
+            'kinetic_energy_final':   final['kinetic_energy'],
+            'kinetic_energy_drift':   (final['kinetic_energy'] - energy) / energy if energy else 0.0}
+
+def finished(path, fieldnames):
+    # 读取已完成的组合，表头与本次扫描不同时不能续写
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline = '') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames and reader.fieldnames != fieldnames:
+            raise ValueError(f"{path} was written by a sweep with different parameters")
+        return {row['key'] for row in reader}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Run a grid of batch configurations in a process pool")
+    parser.add_argument('sweep', help = "JSON file with the base config and the parameter grid")
+    parser.add_argument('--csv', default = 'sweep.csv', help = "results table, appended to and resumed from")
+    parser.add_argument('--output', default = 'sweep', help = "directory for the output of each combination")
+    parser.add_argument('--workers', type = int, help = "number of worker processes, defaults to the CPU count")
+    args = parser.parse_args()
+
+    with open(args.sweep) as f:
+        spec = json.load(f)
+    base, grid = spec.get('base', {}), spec['grid']
+    # 拼错的参数名会被 batch.run() 忽略，各组合实际上完全相同，因此直接拒绝
+    unknown = [name for name in [*base, *grid] if name not in batch.defaults]
+    if unknown:
+        parser.error(f"unknown parameters {', '.join(unknown)}, expected one of {', '.join(batch.defaults)}")
+
+    fieldnames = ['key', *grid, *metrics]
+    try:
+        done = finished(args.csv, fieldnames)
+    except ValueError as error:
+        parser.error(str(error))
+
+    pending = [(params, config) for params, config in combinations(base, grid) if config_key(config) not in done]
+    total = len(pending) + len(done)
+    print(f"{len(done)} of {total} combinations already done, running {len(pending)}")
+    if not pending:
+        return
+
+    new_file = not os.path.exists(args.csv) or os.path.getsize(args.csv) == 0
+    with open(args.csv, 'a', newline = '') as f, ProcessPoolExecutor(max_workers = args.workers) as executor:
+        writer = csv.DictWriter(f, fieldnames = fieldnames)
+        if new_file:
+            writer.writeheader()
+
+        futures = {}
+        for params, config in pending:
+            key = config_key(config)
+            futures[executor.submit(measure, config, os.path.join(args.output, key))] = (key, params)
+
+        try:
+            for future in as_completed(futures):
+                key, params = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:
+                    # 失败的组合不写入结果，下次运行时重试
+                    print(f"{key} {params} failed: {error!r}")
+                    continue
+                if result is None:
+                    continue
+
+                # 列表、None 等参数值以 JSON 形式写入表格
+                writer.writerow({'key': key,
+                                 **{name: value if isinstance(value, (int, float, str)) else json.dumps(value)
+                                    for name, value in params.items()},
+                                 **result})
+                f.flush()
+                print(f"{key} {params} {result['steps_per_sec']:.2f} steps/s "
+                      f"KE drift {result['kinetic_energy_drift']:+.4f}")
+        except KeyboardInterrupt:
+            print("interrupted, completed combinations are kept in", args.csv)
+            executor.shutdown(cancel_futures = True)
+
+if __name__ == "__main__":
+    main()
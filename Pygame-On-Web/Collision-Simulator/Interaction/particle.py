@@ -1,53 +1,61 @@
 import pygame
 
+from cache import circle_image
+
 class Particle(pygame.sprite.Sprite):
-    def __init__(self, position, velocity, radius, density, groups):
+    # 粒子的物理状态存放在 ParticleStore 中，Particle 只是序号 index 处数据的视图
+    def __init__(self, position, velocity, radius, density, store, groups, index = None):
         super().__init__(groups)
 
-        self.position = pygame.Vector2(position)
-        self.velocity = pygame.Vector2(velocity)
-
-        self.radius  = radius
-        self.density = density
-        self.mass    = density * radius ** 2
-        
-        self.elasticity = 0.95
+        self.store = store
+        # 给定 index 时，粒子的状态已经存放在 store 中（如由快照恢复）
+        if index is None:
+            index = store.add(position, velocity, radius, density)
+        self.index = index
 
         # 密度越大，蓝色越深
         rg_value = 200 - density * 10
         self.color = pygame.Color(rg_value, rg_value, 255)
 
-        self.image = pygame.Surface((2 * radius, 2 * radius))
-        self.image.fill('black')
-        self.image.set_colorkey('black')
-        pygame.draw.circle(self.image, self.color, (radius, radius), radius)
-        self.rect = self.image.get_rect(center = self.position)
-
-    def bounce(self):
-        screen_width, screen_height = pygame.display.get_window_size()
-
-        bound_left   = self.radius
-        bound_right  = screen_width - self.radius
-        bound_top    = self.radius
-        bound_bottom = screen_height - self.radius
-
-        if self.position.x < bound_left:
-            self.position.x = 2.0 * bound_left - self.position.x
-            if self.velocity.x < 0:
-                self.velocity.x *= -1.0
-        elif self.position.x > bound_right:
-            self.position.x = 2.0 * bound_right - self.position.x
-            if self.velocity.x > 0:
-                self.velocity.x *= -1.0
-
-        if self.position.y < bound_top:
-            self.position.y = 2.0 * bound_top - self.position.y
-            if self.velocity.y < 0:
-                self.velocity.y *= -1.0
-        elif self.position.y > bound_bottom:
-            self.position.y = 2.0 * bound_bottom - self.position.y
-            if self.velocity.y > 0:
-                self.velocity.y *= -1.0
+        # 相同半径和颜色的粒子共享同一个图像
+        self.image = circle_image(radius, self.color)
+
+    @property
+    def position(self):
+        return pygame.Vector2(self.store.positions[self.index].tolist())
+
+    @position.setter
+    def position(self, value):
+        self.store.positions[self.index] = value
+
+    @property
+    def velocity(self):
+        return pygame.Vector2(self.store.velocities[self.index].tolist())
+
+    @velocity.setter
+    def velocity(self, value):
+        self.store.velocities[self.index] = value
+
+    @property
+    def radius(self):
+        return float(self.store.radii[self.index])
+
+    @property
+    def density(self):
+        return float(self.store.densities[self.index])
+
+    @property
+    def mass(self):
+        return float(self.store.masses[self.index])
+
+    @property
+    def elasticity(self):
+        return self.store.elasticity
+
+    # 绘制时才根据插值后的位置计算 rect，粒子运动时无需逐个更新
+    @property
+    def rect(self):
+        return self.image.get_rect(center = self.store.render_positions[self.index].tolist())
 
     def collide(self, p2):
         p1 = self
@@ -72,8 +80,3 @@ class Particle(pygame.sprite.Sprite):
             separation.scale_to_length(overlap)
             p1.position += 0.5 * separation
             p2.position -= 0.5 * separation
-
-    def update(self, dt):
-        self.position += self.velocity * dt
-        self.bounce()
-        self.rect.center = self.position
@@ -0,0 +1,107 @@
+import pygame
+import numpy as np
+
+class DirtyRenderer:
+
+    """ 脏矩形渲染类：只擦除和刷新发生变化的区域
+
+    DirtyRenderer(screen, color, threshold)
+
+    与 pygame.sprite.RenderUpdates 相同，每帧先以背景擦除上一帧绘制过的矩形，
+    再绘制本帧内容，并记录本帧绘制的矩形。
+    pygame.display.update() 只刷新上一帧与本帧绘制过的矩形，
+    当这些矩形的总面积超过游戏界面面积的 threshold 倍时，改为刷新整个界面。
+    draw_particles() 直接由 ParticleStore 中的位置数组计算所有粒子的绘制位置，
+    不经过每个精灵的 rect
+
+    """
+
+    def __init__(self, screen, color, threshold = 0.3):
+        self.screen = screen
+        self.color = pygame.Color(color)
+        # 与游戏界面尺寸相同的背景，用于擦除上一帧绘制过的区域
+        self.background = pygame.Surface(screen.get_size())
+        self.background.fill(self.color)
+
+        self.threshold = threshold
+        # enabled 为 False 时与原先相同，每帧覆盖并刷新整个界面
+        self.enabled = True
+
+        # 本帧绘制的矩形，以及需要刷新的矩形，第一帧需要擦除整个界面
+        self.drawn = [screen.get_rect()]
+        self.dirty = []
+        # 上一帧是否刷新了整个界面
+        self.full = True
+
+        # 按粒子序号排列的粒子图像及其尺寸
+        self.images = []
+        self.sizes = np.zeros((0, 2), dtype = int)
+
+    def resize(self, screen):
+        # 窗口尺寸变化后重新生成背景，并擦除整个界面
+        self.screen = screen
+        self.background = pygame.Surface(screen.get_size())
+        self.background.fill(self.color)
+        self.reset()
+
+    def reset(self):
+        # 粒子整体替换（如由快照恢复）后，重新收集粒子图像并重绘整个界面
+        self.images = []
+        self.drawn = [self.screen.get_rect()]
+
+    def toggle(self):
+        self.enabled = not self.enabled
+
+    def clear(self):
+        if self.enabled:
+            self.screen.blits([(self.background, rect, rect) for rect in self.drawn], doreturn = False)
+        else:
+            self.screen.fill(self.color)
+        # 擦除的区域也需要刷新
+        self.dirty = self.drawn
+        self.drawn = []
+
+    def draw(self, group):
+        # 一次性绘制群组中的所有精灵，记录每个精灵所占的矩形
+        sprites = group.sprites()
+        self.drawn.extend(self.screen.blits([(sprite.image, sprite.rect) for sprite in sprites]))
+
+    def draw_particles(self, store, group, offset = (0, 0)):
+        # 粒子个数变化时，按序号重新收集每个粒子共享的圆形图像
+        if len(self.images) != store.num:
+            self.images = [None] * store.num
+            for sprite in group.sprites():
+                self.images[sprite.index] = sprite.image
+            self.sizes = np.array([image.get_size() for image in self.images], dtype = int).reshape(-1, 2)
+
+        # 与 Rect 的 center 相同，将插值后的位置四舍五入后减去图像尺寸的一半
+        # offset 为视野左上角在世界中的位置
+        topleft = np.floor(store.render_positions - offset + 0.5).astype(int) - self.sizes // 2
+
+        # 只绘制与游戏界面相交的粒子
+        visible = np.nonzero(((topleft + self.sizes) > 0).all(axis = 1) &
+                             (topleft < self.screen.get_size()).all(axis = 1))[0]
+        if len(visible) == store.num:
+            images = self.images
+        else:
+            images = [self.images[i] for i in visible.tolist()]
+        self.screen.blits(zip(images, topleft[visible].tolist()), doreturn = False)
+
+        if self.enabled:
+            self.drawn.extend(np.concatenate((topleft[visible], self.sizes[visible]), axis = 1).tolist())
+
+    def add(self, *rects):
+        # 记录由其他方式绘制的矩形，如调试信息
+        self.drawn.extend(rects)
+
+    def update(self):
+        self.dirty.extend(self.drawn)
+
+        screen_rect = self.screen.get_rect()
+        # 矩形可以是 Rect，也可以是 [x, y, width, height] 列表
+        area = sum(rect[2] * rect[3] for rect in self.dirty)
+        self.full = not self.enabled or area > self.threshold * screen_rect.width * screen_rect.height
+        if self.full:
+            pygame.display.update()
+        else:
+            pygame.display.update(self.dirty)
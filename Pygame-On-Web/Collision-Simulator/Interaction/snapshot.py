@@ -0,0 +1,121 @@
+""" 模拟状态快照模块
+
+save(path, arrays, meta)
+load(path)
+validate(path, arrays, meta, keys, fields)
+
+快照文件为带版本号的二进制格式：
+
+    magic (8 字节) | version (uint32) | header 长度 (uint32) | header (JSON) | 数组数据 ...
+
+header 记录 meta 信息以及每个数组的 dtype、shape 和在文件中的偏移量，
+每个数组的起始位置按 64 字节对齐。
+load() 以内存映射（numpy.memmap）方式读取数组，不会一次性读入整个文件，
+因此大场景也能在毫秒级别内打开。
+
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'PGSNAP\r\n'
+VERSION = 1
+ALIGN = 64
+
+# magic、version、header 长度
+prefix = struct.Struct('<8sII')
+
+def align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def save(path, arrays, meta):
+
+    """ 保存快照
+
+    save(path, arrays, meta)
+
+    arrays 为 {名称: NumPy 数组} 字典，meta 为可转换为 JSON 的字典
+
+    """
+
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # header 的长度与数组偏移量相互依赖，先按偏移量为 0 估计 header 长度，再逐步修正
+    header_size = 0
+    while True:
+        offset = align(prefix.size + header_size)
+        layout = {}
+        for name, array in arrays.items():
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = align(offset + array.nbytes)
+        header = json.dumps({'meta': meta, 'arrays': layout}).encode('utf-8')
+        if len(header) <= header_size:
+            break
+        header_size = len(header)
+
+    with open(path, 'wb') as f:
+        f.write(prefix.pack(MAGIC, VERSION, header_size))
+        f.write(header.ljust(header_size))
+        for name, array in arrays.items():
+            f.seek(layout[name]['offset'])
+            f.write(array.tobytes())
+        # 保证文件长度覆盖最后一个数组的对齐填充
+        f.truncate(offset)
+
+def load(path):
+
+    """ 读取快照
+
+    load(path)
+
+    返回 (arrays, meta)，arrays 中的数组为只读的内存映射，
+    文件格式或版本不符时引发 ValueError
+
+    """
+
+    with open(path, 'rb') as f:
+        data = f.read(prefix.size)
+        if len(data) < prefix.size:
+            raise ValueError(f"{path} is not a snapshot file")
+        magic, version, header_size = prefix.unpack(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        if version != VERSION:
+            raise ValueError(f"unsupported snapshot version {version} in {path}")
+        header = json.loads(f.read(header_size))
+
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        shape = tuple(layout['shape'])
+        if 0 in shape:
+            # 空数组无法映射
+            arrays[name] = np.zeros(shape, dtype = layout['dtype'])
+        else:
+            arrays[name] = np.memmap(path, dtype = layout['dtype'], mode = 'r', offset = layout['offset'], shape = shape)
+
+    return arrays, header['meta']
+
+def validate(path, arrays, meta, keys, fields):
+
+    """ 检查快照中的 meta 信息和数组是否完整
+
+    validate(path, arrays, meta, keys, fields)
+
+    keys 为 meta 中必须包含的键，fields 为 {数组名: 列数}，列数为 1 的数组为一维数组，
+    所有数组的长度须相同，不符合时引发 ValueError。
+    读取快照时先检查，再修改模拟状态，检查失败时原有状态不变
+
+    """
+
+    missing = [key for key in keys if key not in meta]
+    missing += [name for name in fields if name not in arrays]
+    if missing:
+        raise ValueError(f"{path} is missing {', '.join(missing)}")
+
+    num = len(arrays[next(iter(fields))])
+    for name, width in fields.items():
+        shape = (num,) if width == 1 else (num, width)
+        if arrays[name].shape != shape:
+            raise ValueError(f"{path}: {name} has shape {arrays[name].shape}, expected {shape}")
@@ -0,0 +1,240 @@
+import math
+
+import pygame
+import numpy as np
+
+from collision import near_pairs, resolve_pairs
+
+# 只需检测右下方向网格中的粒子
+adjoin = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+def counting_sort(cells, num_cells):
+    """ 按网格序号对粒子进行计数排序
+
+    counting_sort(cells, num_cells)
+
+    返回 (order, cell_start, cell_count)：
+    order 为按网格序号排列的粒子序号，
+    网格 c 中的粒子为 order[cell_start[c] : cell_start[c] + cell_count[c]]
+
+    """
+
+    cell_count = np.bincount(cells, minlength = num_cells)
+    cell_start = np.cumsum(cell_count) - cell_count
+    # 网格数不超过 65536 时，16 位整数的稳定排序为基数排序，复杂度 O(n)
+    if num_cells <= 1 << 16:
+        cells = cells.astype(np.uint16)
+    order = np.argsort(cells, kind = 'stable')
+
+    return order, cell_start, cell_count
+
+def expand(first, start, count):
+    # 将每个粒子 first[k] 与 order 中 [start[k], start[k] + count[k]) 的粒子依次配对
+    total = count.sum()
+    firsts = np.repeat(first, count)
+    offsets = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+    seconds = np.repeat(start, count) + offsets
+    return firsts, seconds
+
+def candidate_pairs(cells, order, cell_start, cell_count, Nrow, Ncol):
+    """ 生成同一网格及相邻网格中的候选粒子对
+
+    candidate_pairs(cells, order, cell_start, cell_count, Nrow, Ncol)
+
+    返回粒子序号对数组，每对粒子只出现一次
+
+    """
+
+    num = len(order)
+    # rank 为粒子在 order 中的位置
+    rank = np.arange(num)
+    sorted_cells = cells[order]
+    row = sorted_cells // Ncol
+    col = sorted_cells % Ncol
+
+    # 同一网格中的粒子：只与排在自己之后的粒子配对
+    end = cell_start[sorted_cells] + cell_count[sorted_cells]
+    firsts, seconds = expand(rank, rank + 1, end - rank - 1)
+    all_firsts = [firsts]
+    all_seconds = [seconds]
+
+    # 相邻网格中的粒子
+    for (drow, dcol) in adjoin:
+        next_row = row + drow
+        next_col = col + dcol
+        # 判断行列坐标是否超出网格上下限
+        valid = (next_row >= 0) & (next_col >= 0) & (next_row < Nrow) & (next_col < Ncol)
+        next_cells = next_row[valid] * Ncol + next_col[valid]
+        firsts, seconds = expand(rank[valid], cell_start[next_cells], cell_count[next_cells])
+        all_firsts.append(firsts)
+        all_seconds.append(seconds)
+
+    firsts = order[np.concatenate(all_firsts)]
+    seconds = order[np.concatenate(all_seconds)]
+    return np.stack((firsts, seconds), axis = 1)
+
+def large_pairs(positions, large, size, width, height):
+    """ 生成大粒子与所有粒子之间的候选粒子对
+
+    large_pairs(positions, large, size, width, height)
+
+    大粒子按边长为 size 的粗网格排序，每个粒子与所在粗网格及周围 8 个粗网格中的大粒子配对，
+    size 不小于最大粒子的直径，两个大粒子之间的粒子对只出现一次
+
+    """
+
+    Nrow = int(width  / size) + 1
+    Ncol = int(height / size) + 1
+    row = np.clip((positions[:, 0] / size).astype(int), 0, Nrow - 1)
+    col = np.clip((positions[:, 1] / size).astype(int), 0, Ncol - 1)
+
+    order, cell_start, cell_count = counting_sort(row[large] * Ncol + col[large], Nrow * Ncol)
+    order = large[order]
+
+    rank = np.arange(len(positions))
+    all_firsts = []
+    all_seconds = []
+    for drow in (-1, 0, 1):
+        for dcol in (-1, 0, 1):
+            next_row = row + drow
+            next_col = col + dcol
+            valid = (next_row >= 0) & (next_col >= 0) & (next_row < Nrow) & (next_col < Ncol)
+            next_cells = next_row[valid] * Ncol + next_col[valid]
+            firsts, seconds = expand(rank[valid], cell_start[next_cells], cell_count[next_cells])
+            all_firsts.append(firsts)
+            all_seconds.append(order[seconds])
+
+    firsts = np.concatenate(all_firsts)
+    seconds = np.concatenate(all_seconds)
+    # 去掉粒子与自身的配对；两个粒子都是大粒子时只保留序号较小者在前的一对
+    is_large = np.zeros(len(positions), dtype = bool)
+    is_large[large] = True
+    keep = (firsts != seconds) & ~(is_large[firsts] & (firsts > seconds))
+    return np.stack((seconds[keep], firsts[keep]), axis = 1)
+
+class SortGridGroup(pygame.sprite.Group):
+
+    """ 基于计数排序的均匀网格群组，可直接替换 GridGroup
+
+    SortGridGroup(box_size, store, adaptive)
+
+    每帧根据粒子位置重新计算网格序号并排序，
+    不再为每个网格维护 Python 列表，regrid 的复杂度为 O(n)。
+    adaptive 为 True 时每隔 interval 次 regrid 根据粒子半径分布和粒子密度重新选择网格边长，
+    半径超过网格边长一半的大粒子放入单独的粗网格中处理
+
+    """
+
+    # 以半径的 quantile 分位数确定网格边长
+    quantile = 0.9
+    # 每隔 interval 次 regrid 重新选择网格边长
+    interval = 60
+    # 新边长与当前边长相差超过 tolerance 时才重建网格
+    tolerance = 0.1
+
+    def __init__(self, box_size, store, *sprites, adaptive = True):
+        super().__init__(*sprites)
+
+        self.store = store
+        self.adaptive = adaptive
+
+        # 网格覆盖整个世界，世界边界变化时重新计算行列数
+        self.bounds = store.bounds
+        self.version = self.bounds.version
+        self.resize(box_size)
+
+        self.members    = np.zeros(0, dtype = int)
+        self.large      = np.zeros(0, dtype = int)
+        self.cells      = np.zeros(0, dtype = int)
+        self.order      = np.zeros(0, dtype = int)
+        self.cell_start = np.zeros(self.Nrow * self.Ncol, dtype = int)
+        self.cell_count = np.zeros(self.Nrow * self.Ncol, dtype = int)
+
+        # 碰撞检测生成的候选粒子对个数，每次碰撞检测时累加，由调用者按帧清零
+        self.pair_tests = 0
+        self.regrids = 0
+
+    def resize(self, box_size):
+        self.size = box_size
+        self.width, self.height = self.bounds.size
+        # 计算网格行列数
+        self.Nrow = int(self.width  / self.size) + 1
+        self.Ncol = int(self.height / self.size) + 1
+
+    def best_size(self):
+        radii = self.store.radii
+        if not len(radii):
+            return self.size
+
+        # 大多数粒子能放入网格的最小边长
+        size = 2.0 * float(np.quantile(radii, self.quantile))
+        # 网格总数不超过粒子数的 4 倍，也不超过 65536（保证计数排序为基数排序）
+        max_cells = min(1 << 16, max(4 * len(radii), 64))
+        return max(size, math.sqrt(self.width * self.height / max_cells))
+
+    def adapt(self):
+        size = self.best_size()
+        if abs(size - self.size) > self.tolerance * self.size:
+            self.resize(size)
+
+    def add2grid(self, sprite):
+        # 网格成员在每次 regrid() 时整体重建，这里只需加入群组
+        self.add(sprite)
+
+    def regrid(self):
+        # 定期根据粒子半径分布调整网格边长
+        if self.adaptive and self.regrids % self.interval == 0:
+            self.adapt()
+        self.regrids += 1
+        if self.version != self.bounds.version:
+            self.resize(self.size)
+            self.version = self.bounds.version
+
+        # 半径超过网格边长一半的粒子不放入网格，由 large_pairs 单独处理
+        is_large = self.store.radii > self.size / 2
+        self.members = np.nonzero(~is_large)[0]
+        self.large = np.nonzero(is_large)[0]
+
+        # 根据粒子的位置计算所处网格的序号
+        positions = self.store.positions[self.members]
+        row = np.clip((positions[:, 0] / self.size).astype(int), 0, self.Nrow - 1)
+        col = np.clip((positions[:, 1] / self.size).astype(int), 0, self.Ncol - 1)
+        self.cells = row * self.Ncol + col
+
+        self.order, self.cell_start, self.cell_count = counting_sort(self.cells, self.Nrow * self.Ncol)
+
+    def grid_pairs(self):
+        pairs = candidate_pairs(self.cells, self.order, self.cell_start, self.cell_count, self.Nrow, self.Ncol)
+        return self.members[pairs]
+
+    def outlier_pairs(self):
+        if not self.large.size:
+            return np.zeros((0, 2), dtype = int)
+        positions = self.store.positions
+        radii = self.store.radii
+        size = 2.0 * float(radii[self.large].max())
+        pairs = large_pairs(positions, self.large, size, self.width, self.height)
+
+        # 粗网格中的候选粒子对很多，只保留外接正方形（留出半个网格的余量）相交的粒子对
+        i, j = pairs[:, 0], pairs[:, 1]
+        reach = radii[i] + radii[j] + self.size / 2
+        delta = np.abs(positions[i] - positions[j])
+        return pairs[(delta[:, 0] < reach) & (delta[:, 1] < reach)]
+
+    def collide(self):
+        # 没有粒子时无需处理（radii.max() 不能用于空数组）
+        if self.store.num == 0:
+            return
+        pairs = np.concatenate((self.grid_pairs(), self.outlier_pairs()))
+        self.pair_tests += len(pairs)
+        # 只处理距离在最大半径以内的粒子对
+        radii = self.store.radii
+        resolve_pairs(self.store, near_pairs(self.store.positions, radii, pairs, radii.max()))
+
+    def update(self, dt):
+        # 一次性更新所有粒子位置
+        self.store.step(dt)
+        # 更新粒子所处的网格
+        self.regrid()
+        # 进行碰撞检测和处理
+        self.collide()
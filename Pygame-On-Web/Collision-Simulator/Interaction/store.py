@@ -0,0 +1,176 @@
+import numpy as np
+
+class ParticleStore:
+
+    """ 粒子存储类：以结构数组（structure of arrays）形式存放所有粒子的状态
+
+    ParticleStore(bounds, capacity)
+
+    位置、速度、半径、质量、密度分别存放在连续的 NumPy 数组中，
+    Particle 只记录自身在数组中的序号 index。
+    所有粒子的运动与世界边界 bounds 处的反弹由 step() 一次性完成。
+
+    """
+
+    def __init__(self, bounds, capacity = 1024, elasticity = 0.95):
+        self.bounds = bounds
+        # 上一次反弹时世界边界的版本
+        self.version = bounds.version
+
+        # 当前粒子个数
+        self.num = 0
+        self.capacity = 0
+
+        self.elasticity = elasticity
+
+        self.position_array  = np.zeros((0, 2))
+        self.velocity_array  = np.zeros((0, 2))
+        self.radius_array    = np.zeros(0)
+        self.mass_array      = np.zeros(0)
+        self.density_array   = np.zeros(0)
+        # 上一步的位置以及插值后用于绘制的位置
+        self.previous_array  = np.zeros((0, 2))
+        self.render_array    = np.zeros((0, 2))
+
+        self.reserve(capacity)
+
+    def reserve(self, capacity):
+        # 数组容量不足时重新分配，并复制已有粒子的数据
+        if capacity <= self.capacity:
+            return
+
+        def grow(array):
+            new_array = np.zeros((capacity,) + array.shape[1:])
+            new_array[:self.num] = array[:self.num]
+            return new_array
+
+        self.position_array = grow(self.position_array)
+        self.velocity_array = grow(self.velocity_array)
+        self.radius_array   = grow(self.radius_array)
+        self.mass_array     = grow(self.mass_array)
+        self.density_array  = grow(self.density_array)
+        self.previous_array = grow(self.previous_array)
+        self.render_array   = grow(self.render_array)
+
+        self.capacity = capacity
+
+    def attach(self, arrays):
+        # 以外部分配的数组（例如共享内存）代替 {数组名: 数组} 中的各个数组，并复制已有粒子的数据
+        # 各数组容量相同；之后 reserve() 扩容时会重新分配为普通数组
+        capacity = len(next(iter(arrays.values())))
+        self.reserve(capacity)
+        for name, array in arrays.items():
+            array[:self.num] = getattr(self, name)[:self.num]
+            setattr(self, name, array)
+
+    def add(self, position, velocity, radius, density):
+        # 容量翻倍，保证逐个添加粒子的均摊复杂度为 O(1)
+        if self.num >= self.capacity:
+            self.reserve(max(2 * self.capacity, 1))
+
+        index = self.num
+        self.position_array[index] = position
+        self.velocity_array[index] = velocity
+        self.radius_array[index]   = radius
+        self.density_array[index]  = density
+        self.mass_array[index]     = density * radius ** 2
+        self.previous_array[index] = position
+        self.render_array[index]   = position
+
+        self.num += 1
+        return index
+
+    def state(self):
+        # 保存快照所需的数组，质量由密度和半径计算，无需保存
+        return {'positions':  self.positions,
+                'velocities': self.velocities,
+                'radii':      self.radii,
+                'densities':  self.densities,
+                'previous':   self.previous_array[:self.num]}
+
+    def restore(self, arrays, elasticity):
+        # 由快照中的数组恢复所有粒子的状态，原有粒子全部丢弃
+        num = len(arrays['positions'])
+        self.num = 0
+        self.reserve(num)
+        self.num = num
+
+        self.elasticity = elasticity
+        self.positions[:]  = arrays['positions']
+        self.velocities[:] = arrays['velocities']
+        self.radii[:]      = arrays['radii']
+        self.densities[:]  = arrays['densities']
+        self.masses[:]     = self.densities * self.radii ** 2
+        self.previous_array[:num] = arrays['previous']
+        self.render_positions[:]  = self.positions
+
+    # 以下属性仅返回有效粒子部分的数组视图，修改视图即修改粒子状态
+    @property
+    def positions(self):
+        return self.position_array[:self.num]
+
+    @property
+    def velocities(self):
+        return self.velocity_array[:self.num]
+
+    @property
+    def radii(self):
+        return self.radius_array[:self.num]
+
+    @property
+    def masses(self):
+        return self.mass_array[:self.num]
+
+    @property
+    def densities(self):
+        return self.density_array[:self.num]
+
+    @property
+    def render_positions(self):
+        return self.render_array[:self.num]
+
+    def clamp(self):
+        # 世界缩小后，将边界外的粒子移回边界内
+        r = self.radii[:, None]
+        upper = np.array(self.bounds.size)
+        self.positions[:] = np.clip(self.positions, r, np.maximum(upper - r, r))
+        self.previous_array[:self.num] = self.positions
+
+    def bounce(self):
+        if self.version != self.bounds.version:
+            self.clamp()
+            self.version = self.bounds.version
+        screen_width, screen_height = self.bounds.size
+
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        vx = self.velocities[:, 0]
+        vy = self.velocities[:, 1]
+        r = self.radii
+
+        # 与 Particle.bounce 相同：越过边界的粒子以边界为轴镜像，速度指向界内
+        left = x < r
+        right = ~left & (x > screen_width - r)
+        x[left]  = 2.0 * r[left] - x[left]
+        vx[left] = np.abs(vx[left])
+        x[right]  = 2.0 * (screen_width - r[right]) - x[right]
+        vx[right] = -np.abs(vx[right])
+
+        top = y < r
+        bottom = ~top & (y > screen_height - r)
+        y[top]  = 2.0 * r[top] - y[top]
+        vy[top] = np.abs(vy[top])
+        y[bottom]  = 2.0 * (screen_height - r[bottom]) - y[bottom]
+        vy[bottom] = -np.abs(vy[bottom])
+
+    def step(self, dt):
+        # 记录更新前的位置，用于插值绘制
+        self.previous_array[:self.num] = self.positions
+        # 一次性更新所有粒子的位置，并处理边界反弹
+        self.positions[:] += self.velocities * dt
+        self.bounce()
+
+    def interpolate(self, alpha):
+        # 在上一步与当前位置之间线性插值，alpha 为 0 时为上一步的位置
+        previous = self.previous_array[:self.num]
+        self.render_positions[:] = previous + alpha * (self.positions - previous)
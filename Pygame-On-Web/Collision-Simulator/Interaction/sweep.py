@@ -0,0 +1,63 @@
+import numpy as np
+
+from sortgrid import expand
+from collision import resolve_pairs
+
+class SweepPrune:
+
+    """ 扫描裁剪（sweep and prune）碰撞检测
+
+    SweepPrune(store)
+
+    将所有粒子按 x 方向区间的左端点排序，只有 x 区间相交的粒子才需要进一步检测。
+    排序结果在帧与帧之间保留，粒子每帧移动很小，序列几乎有序，
+    稳定排序（timsort）在几乎有序的序列上接近线性复杂度，与插入排序同样利用了时间相干性
+
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.order = np.zeros(0, dtype = int)
+        # 碰撞检测中 x 区间相交的粒子对个数，每次碰撞检测时累加，由调用者按帧清零
+        self.pair_tests = 0
+
+    def reset(self):
+        # 粒子整体替换（如由快照恢复）后，上一帧的排序不再有效
+        self.order = np.zeros(0, dtype = int)
+
+    def sort(self):
+        # 新加入的粒子接在上一帧的序列之后
+        num = self.store.num
+        if len(self.order) < num:
+            self.order = np.concatenate((self.order, np.arange(len(self.order), num)))
+
+        left = self.store.positions[self.order, 0] - self.store.radii[self.order]
+        self.order = self.order[np.argsort(left, kind = 'stable')]
+
+    def candidate_pairs(self):
+        order = self.order
+        x = self.store.positions[order, 0]
+        y = self.store.positions[order, 1]
+        r = self.store.radii[order]
+
+        left = x - r
+        right = x + r
+        # 排在第 k 个粒子之后、左端点小于其右端点的粒子与之 x 区间相交
+        rank = np.arange(len(order))
+        stop = np.searchsorted(left, right, side = 'left')
+        firsts, seconds = expand(rank, rank + 1, np.maximum(stop - rank - 1, 0))
+        self.pair_tests += len(firsts)
+
+        # 再检查 y 方向区间是否相交
+        overlap = np.abs(y[firsts] - y[seconds]) < r[firsts] + r[seconds]
+        return np.stack((order[firsts[overlap]], order[seconds[overlap]]), axis = 1)
+
+    def collide(self):
+        self.sort()
+        resolve_pairs(self.store, self.candidate_pairs())
+
+    def update(self, dt):
+        # 一次性更新所有粒子位置
+        self.store.step(dt)
+        # 进行碰撞检测和处理
+        self.collide()
@@ -0,0 +1,26 @@
+""" 圆形粒子图像缓存模块
+
+circle_image(radius, color)
+
+返回半径为 radius、颜色为 color 的圆形图像。
+相同 (radius, color) 的粒子共享同一个 Surface，而不是各自绘制一份，
+缓存为进程内共享、容量有限的 LRU 缓存。
+共享的图像不可被修改。
+
+"""
+
+import functools
+
+import pygame
+
+@functools.lru_cache(maxsize = 1024)
+def draw_circle(radius, color):
+    image = pygame.Surface((2 * radius, 2 * radius))
+    image.fill('black')
+    image.set_colorkey('black')
+    pygame.draw.circle(image, color, (radius, radius), radius)
+    return image
+
+def circle_image(radius, color):
+    # pygame.Color 不可哈希，转换为 (r, g, b, a) 元组作为缓存的键
+    return draw_circle(int(radius), tuple(pygame.Color(color)))
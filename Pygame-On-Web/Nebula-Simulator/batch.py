@@ -0,0 +1,166 @@
+""" 无窗口批量模拟
+
+python batch.py config.json [--output batch] [--steps 10000]
+
+使用 SDL 的 dummy 视频驱动，不打开游戏窗口，不进行绘制，
+由配置文件生成场景，以固定步长反复调用与游戏中相同的 NebulaGroup.update()，
+定期保存快照（可在游戏中按 F9 键读取）并记录统计数据。
+
+配置文件为 JSON 格式，未给出的项使用 defaults 中的默认值，例如：
+
+    {"particles": 20000, "solver": "barnes-hut", "theta": 0.5, "integrator": "leapfrog",
+     "steps": 10000, "snapshot_every": 1000}
+
+输出目录中包含：
+    step_XXXXXXXX.snap  每隔 snapshot_every 步保存的快照
+    stats.csv           每隔 stats_every 步记录的粒子数、合并次数、动能、动量和耗时
+    summary.json        配置、总步数、总耗时与最终统计数据
+
+按 Ctrl+C 中断时，保存当前步的快照和统计数据后退出。
+
+"""
+
+import os
+# 必须在 pygame 初始化之前指定 dummy 视频驱动
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import csv
+import json
+import random
+import time
+
+import pygame
+
+from game import Game
+from group import NebulaGroup
+
+defaults = {'dims':           [1200, 800],
+            'particles':      1000,
+            'solver':         'exact',
+            'theta':          0.5,
+            'integrator':     'euler',
+            'steps':          1000,
+            'dt':             1 / 60,
+            'seed':           0,
+            'load':           None,
+            'snapshot_every': 1000,
+            'stats_every':    100}
+
+def build(config):
+    # 与游戏中相同的方式生成粒子，随机数种子固定，保证结果可重复
+    random.seed(config['seed'])
+    game = Game(tuple(config['dims']))
+
+    nebula = NebulaGroup()
+    if config['load']:
+        game.load(config['load'], nebula, [nebula])
+    else:
+        game.generate(config['particles'], [nebula])
+    # 配置文件中的引力计算方法优先于快照中的设置
+    nebula.solver = config['solver']
+    nebula.theta = config['theta']
+    nebula.integrator = config['integrator']
+
+    return game, nebula
+
+def statistics(game, nebula):
+    # 总质量、总动能与总动量，粒子合并时质量和动量守恒，动能减少
+    arrays = game.state(nebula.sprites())
+    masses = arrays['masses']
+    velocities = arrays['velocities']
+    momentum = (masses[:, None] * velocities).sum(axis = 0)
+    return {'particles':      len(masses),
+            'total_mass':     float(masses.sum()),
+            'kinetic_energy': float(0.5 * (masses * (velocities ** 2).sum(axis = 1)).sum()),
+            'momentum_x':     float(momentum[0]),
+            'momentum_y':     float(momentum[1])}
+
+def run(config, output, verbose = True):
+    os.makedirs(output, exist_ok = True)
+    game, nebula = build(config)
+
+    def save(done):
+        game.save(os.path.join(output, f"step_{done:08d}.snap"), nebula)
+
+    initial = statistics(game, nebula)
+    if verbose:
+        print(f"{config['solver']} {initial['particles']} particles, {config['steps']} steps of {config['dt']:.5f} s")
+
+    with open(os.path.join(output, 'stats.csv'), 'w', newline = '') as f:
+        fieldnames = ['step', 'elapsed', 'steps_per_sec', 'merges', *initial.keys()]
+        writer = csv.DictWriter(f, fieldnames = fieldnames)
+        writer.writeheader()
+
+        done = 0
+        start = time.perf_counter()
+        last_time, last_done = start, 0
+        try:
+            while done < config['steps']:
+                nebula.update(config['dt'])
+                done += 1
+
+                if done % config['stats_every'] == 0 or done == config['steps']:
+                    now = time.perf_counter()
+                    stats = statistics(game, nebula)
+                    row = {'step':          done,
+                           'elapsed':       now - start,
+                           'steps_per_sec': (done - last_done) / (now - last_time),
+                           # 每次合并使粒子数减少 1
+                           'merges':        initial['particles'] - stats['particles'],
+                           **stats}
+                    writer.writerow(row)
+                    f.flush()
+                    if verbose:
+                        print(f"step {done:>8} {row['steps_per_sec']:>9.2f} steps/s  "
+                              f"particles {row['particles']}  KE {row['kinetic_energy']:.4g}")
+                    last_time, last_done = now, done
+
+                if config['snapshot_every'] and done % config['snapshot_every'] == 0:
+                    save(done)
+        except KeyboardInterrupt:
+            print(f"interrupted at step {done}")
+        elapsed = time.perf_counter() - start
+
+    # 最后一步总是保存快照，便于继续运行或在游戏中查看
+    if not config['snapshot_every'] or done % config['snapshot_every'] != 0:
+        save(done)
+
+    final = statistics(game, nebula)
+    summary = {'config':        config,
+               'steps':         done,
+               'elapsed':       elapsed,
+               'steps_per_sec': done / elapsed if elapsed > 0 else 0.0,
+               'merges':        initial['particles'] - final['particles'],
+               'evaluations':   nebula.evaluations,
+               'initial':       initial,
+               'final':         final}
+    with open(os.path.join(output, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent = 2)
+
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless batch run of the nebula simulator physics")
+    parser.add_argument('config', help = "JSON file with the scene and run settings")
+    parser.add_argument('--output', default = 'batch', help = "directory for snapshots and statistics")
+    parser.add_argument('--steps', type = int, help = "override the number of steps in the config")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = {**defaults, **json.load(f)}
+    if args.steps is not None:
+        config['steps'] = args.steps
+    if config['solver'] not in NebulaGroup().solvers:
+        parser.error(f"solver must be one of {', '.join(NebulaGroup().solvers)}")
+    if config['integrator'] not in NebulaGroup().integrators:
+        parser.error(f"integrator must be one of {', '.join(NebulaGroup().integrators)}")
+
+    summary = run(config, args.output)
+    print(f"{summary['steps']} steps in {summary['elapsed']:.1f} s, "
+          f"{summary['steps_per_sec']:.2f} steps/s, {summary['merges']} merges")
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+""" 无窗口性能测试
+
+python benchmark.py [--modes exact barnes-hut] [--counts 100 1000 10000 100000]
+                    [--steps 50] [--dt 0.01] [--seed 0] [--budget 10] [--csv result.csv]
+
+使用 SDL 的 dummy 视频驱动，不打开游戏窗口，不经过 clock.tick() 和事件循环，
+以固定随机数种子生成粒子、以固定的 dt 反复调用物理更新，
+统计每秒步数、每个粒子每步耗时（纳秒）以及峰值内存。
+
+"""
+
+import os
+# 必须在 pygame 初始化之前指定 dummy 视频驱动
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import csv
+import random
+import time
+import tracemalloc
+
+import pygame
+
+from game import Game
+from group import NebulaGroup
+
+dims = (1200, 800)
+
+def build(mode, num, seed):
+    # 与游戏中相同的方式生成粒子，随机数种子固定，保证结果可重复
+    random.seed(seed)
+    game = Game(dims)
+
+    nebula = NebulaGroup()
+    nebula.solver = mode
+    game.generate(num, [nebula])
+
+    return nebula
+
+def measure(mode, num, steps, dt, seed, budget):
+    nebula = build(mode, num, seed)
+
+    # 计时：最多运行 steps 步，超出时间预算 budget 秒后提前结束
+    done = 0
+    # 粒子合并后粒子数减少，累计每一步开始时的粒子数作为总的粒子-步数
+    particle_steps = 0
+    start = time.perf_counter_ns()
+    while done < steps:
+        particle_steps += len(nebula)
+        nebula.update(dt)
+        done += 1
+        if time.perf_counter_ns() - start > budget * 1e9:
+            break
+    elapsed = time.perf_counter_ns() - start
+    # 粒子合并后剩余的粒子数
+    remain = len(nebula)
+
+    # 峰值内存：重新生成同样的场景，记录生成和单步更新的内存峰值
+    tracemalloc.start()
+    nebula = build(mode, num, seed)
+    nebula.update(dt)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'mode':          mode,
+            'particles':     num,
+            'steps':         done,
+            'steps_per_sec': done / (elapsed / 1e9),
+            'ns_per_particle_step': elapsed / particle_steps,
+            'peak_mb':       peak / 2 ** 20,
+            'remaining':     remain}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless benchmark of the nebula simulator physics")
+    parser.add_argument('--modes', nargs = '+', default = ['exact', 'barnes-hut'],
+                        choices = ['exact', 'barnes-hut'])
+    parser.add_argument('--counts', nargs = '+', type = int, default = [100, 1000, 10000, 100000])
+    parser.add_argument('--steps', type = int, default = 50)
+    parser.add_argument('--dt', type = float, default = 0.01)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--budget', type = float, default = 10.0,
+                        help = "time budget in seconds for each mode and particle count")
+    parser.add_argument('--exact-limit', type = int, default = 20000,
+                        help = "skip the exact solver above this particle count")
+    parser.add_argument('--csv', help = "also write the results to this CSV file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'mode':>10} {'particles':>10} {'steps':>6} {'steps/s':>10} {'ns/particle-step':>17} {'peak MB':>9} {'remaining':>10}")
+    for mode in args.modes:
+        for num in args.counts:
+            if mode == 'exact' and num > args.exact_limit:
+                continue
+            result = measure(mode, num, args.steps, args.dt, args.seed, args.budget)
+            results.append(result)
+            print(f"{result['mode']:>10} {result['particles']:>10} {result['steps']:>6} "
+                  f"{result['steps_per_sec']:>10.2f} {result['ns_per_particle_step']:>17.1f} "
+                  f"{result['peak_mb']:>9.2f} {result['remaining']:>10}")
+
+    if args.csv and results:
+        with open(args.csv, 'w', newline = '') as f:
+            writer = csv.DictWriter(f, fieldnames = list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
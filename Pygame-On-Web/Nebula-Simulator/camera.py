@@ -1,4 +1,7 @@
 import pygame
+import numpy as np
+
+from spatial import SpatialHash
 
 class Camera(pygame.sprite.Group):
     def __init__(self, size, *sprites):
@@ -6,7 +9,8 @@ class Camera(pygame.sprite.Group):
 
         self.width, self.height = size
         self.screen_center = pygame.Vector2(self.width / 2, self.height / 2)
-        self.rect = pygame.Rect((-self.width, -self.height), (3 * self.width, 3 * self.height))
+        # 屏幕可见区域，位于其外的对象不进行缩放和绘制
+        self.rect = pygame.Rect((0, 0), size)
 
         self.move_speed = 300
         self.scale_speed = 0.6
@@ -18,6 +22,21 @@ class Camera(pygame.sprite.Group):
         self.hover = None
         # 鼠标锁定对象
         self.target = None
+        # 是否跟随锁定对象，跟随时 center 每帧取锁定对象插值后的位置，与绘制位置一致
+        self.follow = False
+
+        # 世界坐标中的空间索引，每帧重建一次，用于鼠标拾取
+        self.spatial = SpatialHash()
+        self.indexed = []
+        self.positions = np.zeros((0, 2))
+        self.radii = np.zeros(0)
+
+        # 物理更新前后两步之间的插值比例
+        self.alpha = 1.0
+
+        # 上一帧绘制和剔除的对象个数
+        self.drawn = 0
+        self.culled = 0
 
         self.color_hover  = 'green'
         self.color_target = 'red'
@@ -26,8 +45,14 @@ class Camera(pygame.sprite.Group):
     def center_target(self):
         # 如果有锁定对象，将锁定对象固定到屏幕中央
         if sprite := self.target:
-            self.center = sprite.position
+            self.center = sprite.render_position(self.alpha)
             self.offset = self.screen_center.copy()
+            self.follow = True
+
+    def follow_target(self):
+        # 跟随锁定对象时，摄像机中心为锁定对象插值后的位置，锁定对象在屏幕上不会抖动
+        if self.follow and (sprite := self.target):
+            self.center = sprite.render_position(self.alpha)
 
     def zoom(self, dt, factor):
         self.scale *= 1 + factor * self.scale_speed * dt
@@ -46,10 +71,34 @@ class Camera(pygame.sprite.Group):
         elif pressed_keys[pygame.K_EQUALS]:
             self.zoom(dt, 1)
 
+    def gather(self):
+        # 每帧收集一次所有对象的位置和半径，供空间索引和视锥剔除使用
+        self.indexed = self.sprites()
+        positions = [sprite.render_position(self.alpha) for sprite in self.indexed]
+        self.positions = np.array([(pos.x, pos.y) for pos in positions]).reshape(-1, 2)
+        self.radii = np.array([sprite.radius for sprite in self.indexed], dtype = float)
+
+    def extents(self):
+        # 对象在屏幕上的显示半径（至少 1 像素）换算到世界坐标
+        return np.maximum(1, (self.radii * self.scale).astype(int)) / self.scale
+
+    def build_index(self):
+        # 以对象在屏幕上的显示尺寸换算到世界坐标，作为拾取范围
+        self.spatial.build(self.positions, self.extents())
+
     # 判断当前鼠标位置是否与游戏中某个对象重合
     def mouse_pick(self, mouse_pos):
-        for sprite in self.sprites():
-            pos = self.project2screen(sprite.position)
+        # 只检查鼠标所在位置附近网格中的对象
+        candidates = self.spatial.query(self.project2real(mouse_pos))
+        for i in candidates.tolist():
+            sprite = self.indexed[i]
+            # 跳过建立索引之后被移除的对象
+            if sprite not in self:
+                continue
+            # 上一帧被剔除的对象没有按当前缩放比例更新图像，先更新再判断
+            sprite.scale_image(self.scale)
+            # 与绘制时相同，使用插值后的位置判断
+            pos = self.project2screen(sprite.render_position(self.alpha))
             rect = sprite.image.get_rect(center = pos)
             if rect.collidepoint(mouse_pos):
                 return sprite
@@ -57,15 +106,17 @@ class Camera(pygame.sprite.Group):
     def on_click(self, mouse_pos):
         # 当在游戏对象上点击鼠标时
         if sprite := self.mouse_pick(mouse_pos):
-            # 将偏移向量设定为锁定目标当前在屏幕上的位置
-            self.offset = self.project2screen(sprite.position)
+            # 将偏移向量设定为锁定目标当前在屏幕上（插值后）的位置
+            pos = sprite.render_position(self.alpha)
+            self.offset = self.project2screen(pos)
             # 将摄像机锁定在目标对象上，center 随对象运动而改变
-            self.center = sprite.position
+            self.center = pos
             self.target = sprite
+            self.follow = True
         # 当在游戏界面空白（无可选对象）处点击鼠标时
         else:
             # 将摄像机解锁，center 不随对象运动而改变
-            self.center = self.center.copy()
+            self.follow = False
 
     def mouse_control(self, dt, mouse_pos, pressed_buttons):
         # 刷新鼠标悬停对象
@@ -101,22 +152,41 @@ class Camera(pygame.sprite.Group):
         finally:
             self.offset -= movement
 
+    def cull(self):
+        # 将屏幕可见区域换算为世界坐标中的矩形，一次性判断所有对象是否可见
+        top_left = self.project2real(self.rect.topleft)
+        bottom_right = self.project2real(self.rect.bottomright)
+        extents = self.extents()
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        visible = ((x + extents >= top_left.x) & (x - extents <= bottom_right.x) &
+                   (y + extents >= top_left.y) & (y - extents <= bottom_right.y))
+        return np.nonzero(visible)[0]
+
     def draw(self, screen):
+        # 视锥剔除，只有可见对象才进行缩放和坐标投影
+        visible = self.cull()
+        self.drawn = len(visible)
+        self.culled = len(self.indexed) - self.drawn
+
         sequence = []
-        for sprite in self.sprites():
+        for i in visible.tolist():
+            sprite = self.indexed[i]
+            # 跳过收集位置之后被移除的对象
+            if sprite not in self:
+                continue
 
             # 游戏对象进行相应缩放
             sprite.scale_image(self.scale)
 
-            pos = self.project2screen(sprite.position)
+            pos = self.project2screen(sprite.render_position(self.alpha))
             rect = sprite.image.get_rect(center = pos)
-            if self.rect.colliderect(rect):
-                sequence.append((sprite.image, rect))
+            sequence.append((sprite.image, rect))
         screen.blits(sequence)
 
         # 鼠标悬停对象周围绘制绿框
         if sprite := self.hover:
-            pos = self.project2screen(sprite.position)
+            pos = self.project2screen(sprite.render_position(self.alpha))
             rect = sprite.image.get_rect(center = pos)
             pygame.draw.ellipse(screen, self.color_hover, rect.inflate(self.border * 2, self.border * 2), self.border)
 
@@ -124,7 +194,7 @@ class Camera(pygame.sprite.Group):
         if sprite := self.target:
             # 判断锁定对象是否被移除
             if sprite in self.sprites():
-                pos = self.project2screen(sprite.position)
+                pos = self.project2screen(sprite.render_position(self.alpha))
                 rect = sprite.image.get_rect(center = pos)
                 pygame.draw.ellipse(screen, self.color_target, rect.inflate(self.border * 2, self.border * 2), self.border)
             else:
@@ -138,5 +208,8 @@ class Camera(pygame.sprite.Group):
         return (pos - self.offset) / self.scale + self.center
 
     def update(self, dt, mouse_pos, pressed_keys, pressed_buttons):
+        self.follow_target()
         self.keyboard_control(dt, pressed_keys)
+        self.gather()
+        self.build_index()
         self.mouse_control(dt, mouse_pos, pressed_buttons)
@@ -0,0 +1,118 @@
+""" 积分方法的能量误差与收敛阶检查
+
+python check_integrators.py [--seeds 1 2 3] [--planets 16] [--time 20] [--dt 1/60]
+
+以固定随机数种子生成一个不会发生合并的场景：中心一个大质量天体，
+周围若干小质量天体在互不相交的椭圆轨道上运行（G = 1）。
+以 euler、leapfrog、yoshida4 三种积分方法分别用步长 dt 和 dt / 2 模拟 time 秒，
+记录总能量的最大相对误差 max |E - E0| / |E0| 与引力计算次数。
+
+步长减半时误差约缩小为 1 / 2^p，p 为积分方法的阶数（euler 为 1，leapfrog 为 2，yoshida4 为 4），
+由两种步长的误差之比估计阶数。
+任何一个种子中粒子发生合并、高阶方法的误差不小于 euler，
+或估计的阶数比理论值低 0.5 以上时以非零状态退出。
+
+另外检查蛙跳法在一步中发生合并后会在下一步重新计算引力（synced 为 False）。
+
+"""
+
+import os
+# 必须在 pygame 初始化之前指定 dummy 视频驱动
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import math
+import random
+import sys
+
+import pygame
+
+from group import NebulaGroup
+from particle import Particle
+
+star_mass = 200000
+planet_mass = 20
+orders = {'euler': 1, 'leapfrog': 2, 'yoshida4': 4}
+
+def build(planets, seed):
+    random.seed(seed)
+    nebula = NebulaGroup()
+    Particle((0, 0), (0, 0), star_mass, nebula)
+    for k in range(planets):
+        # 轨道半径间隔 12，速度为圆轨道速度的 0.85 ~ 1.05 倍，近日点仍远离中心天体
+        r = 80 + 12 * k
+        angle = random.random() * 2.0 * math.pi
+        speed = random.uniform(0.85, 1.05) * math.sqrt(star_mass / r)
+        position = (r * math.cos(angle), r * math.sin(angle))
+        velocity = (-speed * math.sin(angle), speed * math.cos(angle))
+        Particle(position, velocity, planet_mass, nebula)
+    return nebula
+
+def run(integrator, planets, seed, time, dt):
+    nebula = build(planets, seed)
+    nebula.integrator = integrator
+    num = len(nebula)
+
+    base = nebula.energy()
+    error = 0.0
+    for step in range(round(time / dt)):
+        nebula.update(dt)
+        error = max(error, abs(nebula.energy() - base) / abs(base))
+    return error, nebula.evaluations, len(nebula) == num
+
+def check_merge():
+    # 两个相互接触的粒子在第一次引力计算时合并，之后须重新计算第三个粒子的加速度
+    nebula = NebulaGroup()
+    nebula.integrator = 'leapfrog'
+    Particle((0, 0), (0, 0), 2000, nebula)
+    Particle((5, 0), (0, 0), 2000, nebula)
+    Particle((100, 0), (0, 10), 2000, nebula)
+    nebula.update(1 / 60)
+    merged_once = len(nebula) == 2 and nebula.synced
+
+    # 第二步在末尾发生合并
+    nebula = NebulaGroup()
+    nebula.integrator = 'leapfrog'
+    Particle((0, 0), (0, 0), 2000, nebula)
+    Particle((20, 0), (-1200, 0), 2000, nebula)
+    Particle((100, 0), (0, 10), 2000, nebula)
+    nebula.update(1 / 60)
+    return merged_once and len(nebula) == 2 and not nebula.synced
+
+def main():
+    parser = argparse.ArgumentParser(description = "Check energy error and convergence order of the integrators")
+    parser.add_argument('--seeds', nargs = '+', type = int, default = [1, 2, 3])
+    parser.add_argument('--planets', type = int, default = 16)
+    parser.add_argument('--time', type = float, default = 20)
+    parser.add_argument('--dt', type = float, default = 1 / 60)
+    args = parser.parse_args()
+
+    # Particle 的图像需要在设置显示模式之后创建
+    pygame.display.set_mode((1, 1))
+
+    failed = False
+    for seed in args.seeds:
+        errors = {}
+        for integrator, order in orders.items():
+            coarse, evaluations, kept = run(integrator, args.planets, seed, args.time, args.dt)
+            fine, _, kept_fine = run(integrator, args.planets, seed, args.time, args.dt / 2)
+            measured = math.log2(coarse / fine) if fine > 0 else float('inf')
+            errors[integrator] = coarse
+
+            ok = kept and kept_fine and measured >= order - 0.5
+            if integrator != 'euler':
+                ok &= coarse < errors['euler']
+            failed |= not ok
+            print(f"seed {seed} {integrator:>8}: max |dE/E| {coarse:.3e} (dt) {fine:.3e} (dt/2)  "
+                  f"order {measured:.2f}  evaluations {evaluations}  "
+                  f"{'ok' if ok else ('MERGED' if not (kept and kept_fine) else 'FAIL')}")
+
+    resynced = check_merge()
+    failed |= not resynced
+    print(f"leapfrog resync after merge: {'ok' if resynced else 'FAIL'}")
+
+    pygame.quit()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
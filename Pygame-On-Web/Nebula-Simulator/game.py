@@ -5,12 +5,18 @@ import asyncio
 import random
 import math
 
+import numpy as np
+
 # 引入 debug 模块，方便在游戏界面上输出调试信息
 from debug import Debug
 from particle import Particle
 from group import NebulaGroup
 from ui import UIGroup, Button, MouseMove
 from camera import Camera
+from timestep import FixedTimestep
+from profiler import Profiler
+import snapshot
+from recorder import Recorder, Trajectory
 
 class Game:
 
@@ -28,6 +34,9 @@ class Game:
 
         self.time_shift = 3
         self.time_speeds = (0.125, 0.25, 0.5, 1, 2, 4, 8)
+        # 物理更新使用固定步长，每帧最多更新 max_steps 步
+        self.base_step = 1 / 60
+        self.timestep = FixedTimestep(self.base_step, 8)
 
         # 初始化pygame，预定义各种常量
         pygame.init()
@@ -42,6 +51,14 @@ class Game:
 
         self.total_num = 0
 
+        # 快照文件的路径
+        self.snapshot_path = 'nebula.snap'
+        # 轨迹文件的路径，记录每一步物理更新后的粒子状态
+        self.trajectory_path = 'nebula.traj'
+        self.trajectory_fields = {'positions':  ('<f8', 2),
+                                  'velocities': ('<f8', 2),
+                                  'masses':     ('<f8', 1)}
+
     def generate(self, num, groups):
 
         """ 生成 num 个随机粒子
@@ -68,6 +85,134 @@ class Game:
 
             Particle(pos_real, velocity, 2000, groups)
 
+    def state(self, sprites):
+        # 将粒子状态收集为数组，用于保存快照和记录轨迹
+        return {'positions':  np.array([tuple(sprite.position) for sprite in sprites]).reshape(-1, 2),
+                'velocities': np.array([tuple(sprite.velocity) for sprite in sprites]).reshape(-1, 2),
+                'previous':   np.array([tuple(sprite.previous) for sprite in sprites]).reshape(-1, 2),
+                'masses':     np.array([sprite.mass for sprite in sprites], dtype = float)}
+
+    def save(self, path, nebula):
+
+        """ 将所有粒子的状态、摄像机和程序运行速度保存为快照文件
+
+        save(path, nebula)
+
+        """
+
+        sprites = nebula.sprites()
+        arrays = self.state(sprites)
+
+        camera = self.camera
+        # 锁定对象以其在粒子列表中的序号保存
+        target = sprites.index(camera.target) if camera.target in sprites else -1
+        meta = {'simulator':  'nebula',
+                'offset':     list(camera.offset),
+                'center':     list(camera.center),
+                'scale':      camera.scale,
+                'target':     target,
+                'time_shift': self.time_shift,
+                'paused':     self.game_paused,
+                'solver':     nebula.solver,
+                'theta':      nebula.theta,
+                'integrator': nebula.integrator}
+        snapshot.save(path, arrays, meta)
+
+    def load(self, path, nebula, groups):
+
+        """ 由快照文件恢复模拟状态
+
+        load(path, nebula, groups)
+
+        原有粒子全部丢弃，由快照中的数组重新生成粒子
+
+        """
+
+        arrays, meta = snapshot.load(path)
+        if meta.get('simulator') != 'nebula':
+            raise ValueError(f"{path} is not a nebula simulator snapshot")
+        # 先检查快照是否完整，再丢弃原有粒子，读取失败时模拟状态不变
+        snapshot.validate(path, arrays, meta, ('offset', 'center', 'scale', 'target', 'time_shift', 'paused', 'solver', 'theta'),
+                          {'masses': 1, 'positions': 2, 'velocities': 2, 'previous': 2})
+        if meta['target'] >= len(arrays['positions']):
+            raise ValueError(f"{path} has an invalid camera target")
+
+        for group in groups:
+            group.empty()
+
+        sprites = []
+        for position, velocity, previous, mass in zip(arrays['positions'].tolist(), arrays['velocities'].tolist(),
+                                                      arrays['previous'].tolist(), arrays['masses'].tolist()):
+            sprite = Particle(position, velocity, mass, groups)
+            sprite.previous.update(previous)
+            sprites.append(sprite)
+
+        camera = self.camera
+        camera.offset = pygame.Vector2(meta['offset'])
+        camera.scale = meta['scale']
+        camera.hover = None
+        if meta['target'] >= 0:
+            # 锁定对象时 center 随对象运动而改变
+            camera.target = sprites[meta['target']]
+            camera.center = camera.target.render_position(camera.alpha)
+            camera.follow = True
+        else:
+            camera.target = None
+            camera.center = pygame.Vector2(meta['center'])
+            camera.follow = False
+
+        self.time_shift = meta['time_shift']
+        self.game_paused = meta['paused']
+        nebula.solver = meta['solver']
+        nebula.theta = meta['theta']
+        nebula.integrator = meta.get('integrator', 'euler')
+        nebula.error = None
+
+    def record(self, nebula):
+
+        """ 开始记录轨迹
+
+        record(nebula)
+
+        返回 Recorder，每一步物理更新后调用 recorder.record() 记录一帧
+
+        """
+
+        meta = {'simulator':  'nebula',
+                'step':       self.base_step,
+                'solver':     nebula.solver,
+                'theta':      nebula.theta,
+                'integrator': nebula.integrator}
+        return Recorder(self.trajectory_path, self.trajectory_fields, meta)
+
+    def replay(self, arrays, replay_group):
+
+        """ 将轨迹中的一帧写入回放使用的粒子
+
+        replay(arrays, replay_group)
+
+        回放时不进行物理更新，只替换粒子位置和质量，粒子个数变化（合并）时重新生成粒子
+
+        """
+
+        positions = arrays['positions'].tolist()
+        masses = arrays['masses'].tolist()
+        sprites = replay_group.sprites()
+        if len(sprites) != len(positions):
+            for sprite in sprites:
+                sprite.kill()
+            self.camera.target = None
+            self.camera.hover = None
+            for position, velocity, mass in zip(positions, arrays['velocities'].tolist(), masses):
+                Particle(position, velocity, mass, [replay_group, self.camera])
+        else:
+            # 原地修改位置，锁定对象时 center 随之改变
+            for sprite, position, mass in zip(sprites, positions, masses):
+                sprite.position.update(position)
+                sprite.previous.update(position)
+                if sprite.mass != mass:
+                    sprite.update_mass(mass)
+
     def time_control(self, shift):
         self.time_shift += shift
         self.time_shift = max(0, min(self.time_shift, len(self.time_speeds) - 1))
@@ -81,6 +226,8 @@ class Game:
         screen_width, screen_height = screen.get_size()
 
         debug = Debug(screen, 8)
+        # 按 F3 键显示各阶段耗时，未启用时几乎没有额外开销
+        profiler = Profiler()
 
         # 初始化游戏时钟（clock），用于控制游戏帧率
         clock = pygame.time.Clock()
@@ -102,6 +249,30 @@ class Game:
                               self.game_pause,   'SPACE',  uis)
 
         mousemove = MouseMove((1120, 750), uis)
+
+        # 按 F7 键开始或停止记录轨迹，记录在后台线程中压缩写入
+        recorder = None
+        # 按 F8 键回放轨迹，回放时不进行物理更新，由 replay_particles 代替原有粒子进行绘制
+        trajectory = None
+        replay_frame = 0
+        replay_particles = pygame.sprite.Group()
+        # 回放时按 PageUp、PageDown 键后退或前进 1 秒，按 Home 键回到开头，帧数由轨迹中记录的步长得到
+        seek_steps = round(1 / self.base_step)
+
+        # 读取快照或轨迹失败时，在界面中央显示错误信息 message_time 毫秒
+        message = None
+        message_until = 0
+        message_time = 3000
+
+        # 按 E 键显示能量漂移，能量计算为 O(n²)，只在显示时进行
+        show_energy = False
+        # 能量漂移的基准：(初始能量, 粒子数, 引力计算次数, 模拟时间)，粒子数变化时重新记录
+        energy_base = None
+        drift = 0.0
+        evaluation_rate = 0.0
+        # 模拟经过的总时间
+        sim_time = 0.0
+
         # 初始化鼠标位置
         mouse_pos = pygame.mouse.get_pos()
 
@@ -114,23 +285,27 @@ class Game:
             # 按照给定的 FPS 刷新游戏
             # clock.tick() 函数返回上一次调用该函数后经历的时间，单位为毫秒 ms
             # dt 记录上一帧接受之后经历的时间，单位为秒 m
-            # 使用 dt 控制物体运动可以使游戏物理过程与帧率无关
+            # dt 交给 self.timestep 累积，物理过程以固定步长进行，与帧率无关
             dt = clock.tick(self.FPS) / 1000.0
             pygame.display.set_caption(f"Nebula Simulator [FPS={clock.get_fps():.1f}]")
             # 使用 asyncio 同步
             # 此外游戏主体代码中不需要再考虑 asyncio
             await asyncio.sleep(0)
+            profiler.start()
 
             # 游戏事件处理
             # 包括键盘、鼠标输入等
+            # 回放时不能添加粒子
+            button_plus.is_available = trajectory is None
             for event in pygame.event.get():
                 # 点击关闭窗口按钮或关闭网页
                 if event.type == pygame.QUIT:
                     game_running = False
                 elif event.type == pygame.KEYDOWN:
-                    # 按 P 键添加随机粒子
+                    # 按 P 键添加随机粒子，回放时不添加
                     if event.key == pygame.K_p:
-                        self.generate(10, groups)
+                        if trajectory is None:
+                            self.generate(10, groups)
                     elif event.key == pygame.K_c:
                         self.camera.center_target()
                     elif event.key == pygame.K_COMMA:
@@ -139,6 +314,79 @@ class Game:
                         self.time_control(1)
                     elif event.key == pygame.K_SPACE:
                         self.game_pause()
+                    # 按 B 键切换引力计算方法，按 [ ] 键调整 Barnes–Hut 张角
+                    elif event.key == pygame.K_b:
+                        nebula.switch_solver()
+                    # 按 I 键切换积分方法
+                    elif event.key == pygame.K_i:
+                        nebula.switch_integrator()
+                        energy_base = None
+                    # 按 E 键显示或隐藏能量漂移
+                    elif event.key == pygame.K_e:
+                        show_energy = not show_energy
+                        energy_base = None
+                    elif event.key == pygame.K_LEFTBRACKET:
+                        nebula.tune_theta(-0.1)
+                    elif event.key == pygame.K_RIGHTBRACKET:
+                        nebula.tune_theta(0.1)
+                    # 按 F3 键显示或隐藏耗时分析
+                    elif event.key == pygame.K_F3:
+                        profiler.toggle()
+                    # 按 F5 键保存快照，按 F9 键由快照恢复
+                    elif event.key == pygame.K_F5:
+                        self.save(self.snapshot_path, nebula)
+                    elif event.key == pygame.K_F9:
+                        try:
+                            self.load(self.snapshot_path, nebula, groups)
+                        except (OSError, ValueError, KeyError) as error:
+                            message = str(error)
+                            message_until = pygame.time.get_ticks() + message_time
+                        else:
+                            energy_base = None
+                    # 按 F7 键开始或停止记录轨迹
+                    elif event.key == pygame.K_F7:
+                        if recorder is None:
+                            recorder = self.record(nebula)
+                        else:
+                            recorder.close()
+                            recorder = None
+                    # 按 F8 键进入或退出回放模式，进入回放前先结束记录
+                    elif event.key == pygame.K_F8:
+                        if trajectory is None:
+                            if recorder is not None:
+                                recorder.close()
+                                recorder = None
+                            try:
+                                trajectory = Trajectory(self.trajectory_path)
+                            except (OSError, ValueError, KeyError) as error:
+                                message = str(error)
+                                message_until = pygame.time.get_ticks() + message_time
+                            else:
+                                if trajectory.frames == 0:
+                                    trajectory.close()
+                                    trajectory = None
+                                else:
+                                    # 摄像机改为绘制回放的粒子
+                                    self.camera.remove(nebula.sprites())
+                                    self.camera.target = None
+                                    self.camera.hover = None
+                                    replay_frame = 0
+                                    seek_steps = max(round(1 / trajectory.meta.get('step', self.base_step)), 1)
+                                    self.replay(trajectory.frame(0), replay_particles)
+                        else:
+                            trajectory.close()
+                            trajectory = None
+                            for sprite in replay_particles.sprites():
+                                sprite.kill()
+                            self.camera.add(nebula.sprites())
+                            self.camera.target = None
+                            self.camera.hover = None
+                    elif trajectory is not None and event.key == pygame.K_PAGEUP:
+                        replay_frame = max(replay_frame - seek_steps, 0)
+                    elif trajectory is not None and event.key == pygame.K_PAGEDOWN:
+                        replay_frame = min(replay_frame + seek_steps, trajectory.frames - 1)
+                    elif trajectory is not None and event.key == pygame.K_HOME:
+                        replay_frame = 0
                 elif event.type == pygame.MOUSEMOTION:
                     # 当鼠标移动时更新鼠标所在位置
                     mouse_pos = event.pos
@@ -154,6 +402,7 @@ class Game:
 
             # 以背景色覆盖刷新游戏界面
             screen.fill(self.screen_color)
+            profiler.mark('events')
 
             # 调用 NebulaGroup 类的 update() 函数，更新粒子状态
             if not self.game_paused:
@@ -161,37 +410,110 @@ class Game:
                 button_fast.is_available = True
                 button_slow.is_available = True
 
+                # 将本帧经历的时间按程序运行速度放缩，换算为若干个固定步长的物理更新
                 time_speed = self.time_speeds[self.time_shift]
-                if time_speed > 1:
-                    for i in range(int(time_speed / 2)):
-                        nebula.update(dt * 2)
-                else:
-                    nebula.update(dt * time_speed)
+                # 辛积分方法在快进时以 time_speed 倍的步长更新，引力计算次数不随速度增加
+                # 记录轨迹时每一帧的时间间隔须与轨迹中记录的 step 相同，不放大步长
+                stride = 1
+                if nebula.integrator != 'euler' and time_speed > 1 and trajectory is None and recorder is None:
+                    stride = int(time_speed)
+                self.timestep.step = self.base_step * stride
+                steps = self.timestep.advance(dt * time_speed)
+                if trajectory is not None:
+                    # 回放模式：每一步前进一帧，到达结尾后从头循环
+                    replay_frame = (replay_frame + steps) % trajectory.frames
+                    steps = 0
+
+                for i in range(steps):
+                    nebula.update(self.timestep.step)
+                    sim_time += self.timestep.step
+                    profiler.mark('physics')
+
+                    # 主线程中只收集和复制数组，压缩和写入由后台线程完成
+                    if recorder is not None:
+                        recorder.record(self.state(nebula.sprites()))
+                        profiler.mark('record')
             else:
                 button_pause.is_available = True
                 button_fast.is_available = False
                 button_slow.is_available = False
 
+            # 由轨迹中的任意一帧直接得到粒子位置，暂停时也可以前后跳转
+            if trajectory is not None:
+                self.replay(trajectory.frame(replay_frame), replay_particles)
+                profiler.mark('replay')
+
+            # 计算能量相对于基准的漂移，以及每模拟 1 秒的引力计算次数
+            if show_energy and trajectory is None:
+                num = len(nebula)
+                if energy_base is None or energy_base[1] != num:
+                    energy_base = (nebula.energy(), num, nebula.evaluations, sim_time)
+                    drift = 0.0
+                    evaluation_rate = 0.0
+                elif sim_time > energy_base[3]:
+                    energy0 = energy_base[0]
+                    drift = (nebula.energy() - energy0) / abs(energy0) if energy0 else 0.0
+                    evaluation_rate = (nebula.evaluations - energy_base[2]) / (sim_time - energy_base[3])
+                profiler.mark('energy')
+
+            # 在前后两步之间插值绘制粒子
+            self.camera.alpha = self.timestep.alpha
             # 调用 Camera 类的 update() 和 draw() 函数，绘制粒子
             self.camera.update(dt, mouse_pos, pressed_keys, pressed_buttons)
+            profiler.mark('camera')
             self.camera.draw(screen)
+            profiler.mark('draw')
 
             # 根据鼠标位置和键盘按键信息更新组件的外观渲染
             uis.update(mouse_pos, pressed_keys, pressed_buttons)
             uis.draw(screen)
+            profiler.mark('ui')
 
-            # 调用 debug 函数在游戏界面上方中间显示粒子个数
-            self.total_num = len(nebula.sprites())
+            # 调用 debug 函数在游戏界面上方中间显示粒子个数，回放时显示回放的粒子个数
+            self.total_num = len((nebula if trajectory is None else replay_particles).sprites())
             debug.debug(self.total_num, 'white', 'midtop')
             # 调用 debug 函数在游戏界面左上角显示游戏帧率
             debug.debug(f"{clock.get_fps():.1f}", 'green')
+            # 调用 debug 函数在游戏界面左下角显示引力计算方法及其误差
+            if nebula.solver == 'barnes-hut':
+                error = '-' if nebula.error is None else f"{nebula.error:.2%}"
+                debug.debug(f"Barnes-Hut theta={nebula.theta:.1f} error={error}", 'white', 'bottomleft')
+            else:
+                debug.debug("Exact", 'white', 'bottomleft')
+            # 在其上方显示积分方法，按 E 键时显示能量漂移和每模拟 1 秒的引力计算次数
+            if show_energy:
+                debug.debug(f"{nebula.integrator} dE/E={drift:+.2e} evals/s={evaluation_rate:.0f}", 'white', 'bottomleft', 1)
+            else:
+                debug.debug(nebula.integrator, 'white', 'bottomleft', 1)
+            # 调用 debug 函数在游戏界面右上角显示绘制和剔除的粒子个数
+            debug.debug(f"drawn {self.camera.drawn} culled {self.camera.culled}", 'white', 'topright')
             # 调用 debug 函数在游戏界面下方中间显示程序运行速度
             if not self.game_paused:
                 debug.debug(f"x {self.time_speeds[self.time_shift]}", 'white', 'midbottom')
+            # 每帧的物理更新步数超过上限时丢弃的模拟时间，此时实际运行速度低于上面显示的速度
+            if self.timestep.dropped > 0:
+                debug.debug(f"dropped {self.timestep.dropped:.1f}s", 'red', 'midbottom', 1)
+            # 在右上角第二行显示记录或回放的进度
+            if trajectory is not None:
+                debug.debug(f"replay {replay_frame}/{trajectory.frames}", 'yellow', 'topright', 1)
+            elif recorder is not None:
+                debug.debug(f"rec {recorder.frames} dropped {recorder.dropped}", 'red', 'topright', 1)
+            # 在界面中央显示读取失败的原因
+            if message is not None and pygame.time.get_ticks() < message_until:
+                debug.debug(message, 'red', 'center')
+            # 在左侧显示上一帧为止各阶段耗时的分位数，FPS 为 0（不限帧率）时以 60 帧为参照
+            profiler.draw(debug, 1000 / (self.FPS or 60))
+            profiler.mark('debug')
 
             # 将游戏界面内容输出至屏幕
             pygame.display.update()
+            profiler.mark('display')
+            profiler.end()
 
         # 当 game_running 为 False 时，
         # 跳出游戏主循环，退出游戏
+        if recorder is not None:
+            recorder.close()
+        if trajectory is not None:
+            trajectory.close()
         pygame.quit()
@@ -0,0 +1,104 @@
+""" 向量化的精确引力计算模块
+
+accelerations(positions, masses, radii, targets, tile)
+potential(positions, masses, radii, tile)
+
+以 NumPy 分块计算所有粒子两两之间的引力加速度，
+每块只计算 tile × tile 个粒子对，内存占用为 O(tile²)。
+相互接触的粒子对不计算引力，而是作为待合并的粒子对返回。
+
+"""
+
+import numpy as np
+
+def tile_interact(positions, radii, rows, cols):
+    # 计算 rows 中的粒子受到 cols 中的粒子的引力加速度
+    dx = positions[cols, 0][None, :] - positions[rows, 0][:, None]
+    dy = positions[cols, 1][None, :] - positions[rows, 1][:, None]
+    d2 = dx * dx + dy * dy
+    touch = d2 < (radii[rows][:, None] + radii[cols][None, :]) ** 2
+    same = rows[:, None] == cols[None, :]
+    # 与 NebulaGroup 相同：d < r1 + r2 时合并，否则 fr = r / d ** 3
+    pull = ~(touch | same)
+    inv_d3 = np.where(pull, d2, 1.0) ** -1.5 * pull
+    return dx * inv_d3, dy * inv_d3, touch & ~same
+
+def accelerations(positions, masses, radii, targets = None, tile = 256):
+    """ 计算引力加速度与待合并的粒子对
+
+    accelerations(positions, masses, radii, targets = None, tile = 256)
+
+    targets 为 None 时计算所有粒子，利用作用力与反作用力只计算一半的粒子对，
+    返回 (acc, pairs)，pairs 为相互接触的粒子对 (i, j)，i < j，按字典序排列；
+    否则只计算 targets 中粒子的加速度，返回 (acc, None)
+
+    """
+
+    num = len(positions)
+    blocks = [np.arange(start, min(start + tile, num)) for start in range(0, num, tile)]
+
+    if targets is not None:
+        acc = np.zeros((len(targets), 2))
+        for start in range(0, len(targets), tile):
+            rows = targets[start:start + tile]
+            for cols in blocks:
+                fx, fy, _ = tile_interact(positions, radii, rows, cols)
+                acc[start:start + tile, 0] += fx @ masses[cols]
+                acc[start:start + tile, 1] += fy @ masses[cols]
+        return acc, None
+
+    acc = np.zeros((num, 2))
+    pairs = []
+    for b, rows in enumerate(blocks):
+        for cols in blocks[b:]:
+            fx, fy, touch = tile_interact(positions, radii, rows, cols)
+            # rows 受到 cols 的引力
+            acc[rows, 0] += fx @ masses[cols]
+            acc[rows, 1] += fy @ masses[cols]
+            # cols 受到 rows 的反作用力，对角块中已经计算过，无需重复
+            if cols[0] != rows[0]:
+                acc[cols, 0] -= masses[rows] @ fx
+                acc[cols, 1] -= masses[rows] @ fy
+
+            ii, jj = np.nonzero(touch)
+            upper = rows[ii] < cols[jj]
+            pairs.append(np.stack((rows[ii][upper], cols[jj][upper]), axis = 1))
+
+    if pairs:
+        pairs = np.concatenate(pairs)
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    else:
+        pairs = np.zeros((0, 2), dtype = int)
+
+    return acc, pairs
+
+def potential(positions, masses, radii, tile = 256):
+    """ 计算总引力势能
+
+    potential(positions, masses, radii, tile = 256)
+
+    与 accelerations() 相同，相互接触（待合并）的粒子对不计入，
+    返回 -Σ m_i m_j / d，i < j
+
+    """
+
+    num = len(positions)
+    blocks = [np.arange(start, min(start + tile, num)) for start in range(0, num, tile)]
+
+    total = 0.0
+    for b, rows in enumerate(blocks):
+        for cols in blocks[b:]:
+            dx = positions[cols, 0][None, :] - positions[rows, 0][:, None]
+            dy = positions[cols, 1][None, :] - positions[rows, 1][:, None]
+            d2 = dx * dx + dy * dy
+            touch = d2 < (radii[rows][:, None] + radii[cols][None, :]) ** 2
+            same = rows[:, None] == cols[None, :]
+            pull = ~(touch | same)
+            inv_d = np.where(pull, d2, 1.0) ** -0.5 * pull
+            energy = masses[rows] @ inv_d @ masses[cols]
+            # 对角块中每个粒子对计算了两次
+            if cols[0] == rows[0]:
+                energy /= 2
+            total -= energy
+
+    return float(total)
@@ -1,5 +1,45 @@
 import pygame
 import math
+import numpy as np
+
+from quadtree import QuadTree
+from spatial import SpatialHash
+import gravity
+
+# 四阶 Yoshida 积分的系数：三次蛙跳法以 w1、w0、w1 为步长比例依次进行
+yoshida_w1 = 1 / (2 - 2 ** (1 / 3))
+yoshida_w0 = -2 ** (1 / 3) * yoshida_w1
+yoshida_drifts = (yoshida_w1 / 2, (yoshida_w0 + yoshida_w1) / 2, (yoshida_w0 + yoshida_w1) / 2, yoshida_w1 / 2)
+yoshida_kicks = (yoshida_w1, yoshida_w0, yoshida_w1)
+
+class DisjointSet:
+
+    """ 并查集：按需创建元素，路径减半并按大小合并 """
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, x):
+        parent = self.parent
+        if x not in parent:
+            parent[x] = x
+            self.size[x] = 1
+            return x
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        x = self.find(x)
+        y = self.find(y)
+        if x == y:
+            return
+        if self.size[x] < self.size[y]:
+            x, y = y, x
+        self.parent[y] = x
+        self.size[x] += self.size[y]
 
 class NebulaGroup(pygame.sprite.Group):
     def __init__(self, *sprites):
@@ -7,50 +47,218 @@ class NebulaGroup(pygame.sprite.Group):
 
         self.combined = []
 
+        # 引力计算方法：'exact' 逐对精确计算，'barnes-hut' 四叉树近似计算
+        self.solvers = ('exact', 'barnes-hut')
+        self.solver = 'exact'
+        # Barnes–Hut 张角，越小越精确
+        self.theta = 0.5
+        # 近似计算相对于精确计算的加速度误差（均方根相对误差）
+        self.error = None
+        # 用于估计误差的抽样粒子数，每 error_every 次引力计算估计一次
+        self.error_samples = 64
+        self.error_every = 60
+        # 近似计算时由空间哈希网格检测相互接触的粒子，与张角 theta 无关
+        self.spatial = SpatialHash()
+        # 粒子数少于 direct_below 时逐对计算比遍历四叉树更快
+        self.direct_below = 1000
+
+        # 积分方法：'euler' 半隐式欧拉，'leapfrog' 蛙跳（速度 Verlet），'yoshida4' 四阶 Yoshida
+        # 蛙跳法每步计算一次引力，四阶 Yoshida 每步计算三次，二者均为辛积分，能量长期不漂移
+        self.integrators = ('euler', 'leapfrog', 'yoshida4')
+        self.integrator = 'euler'
+        # 累计的引力计算次数，用于比较各积分方法的计算量
+        self.evaluations = 0
+        # 粒子的加速度是否与当前位置对应，蛙跳法每步开始时复用上一步末尾的加速度
+        self.synced = False
+
+    def switch_solver(self):
+        index = self.solvers.index(self.solver)
+        self.solver = self.solvers[(index + 1) % len(self.solvers)]
+        self.error = None
+
+    def switch_integrator(self):
+        index = self.integrators.index(self.integrator)
+        self.integrator = self.integrators[(index + 1) % len(self.integrators)]
+        self.synced = False
+
+    def add_internal(self, sprite, layer = None):
+        # 新加入的粒子没有加速度，蛙跳法需要重新计算引力
+        super().add_internal(sprite, layer)
+        self.synced = False
+
+    def tune_theta(self, delta):
+        self.theta = max(0.1, min(self.theta + delta, 1.5))
+        # 下一次引力计算时重新估计误差
+        self.error = None
+
+    def merge(self, p_list, pairs):
+        """ 合并相互接触的粒子
+
+        merge(p_list, pairs)
+
+        以并查集将接触的粒子对连成若干组（A 吞并 B，B 又接触 C 时三者为一组），
+        每组由质量最大的粒子吞并其余粒子，合并前后总质量与总动量守恒
+
+        """
+
+        if not len(pairs):
+            return
+
+        sets = DisjointSet()
+        for (i, j) in pairs.tolist():
+            sets.union(i, j)
+
+        members = np.array(list(sets.parent.keys()))
+        roots = np.array([sets.find(i) for i in members.tolist()])
+        _, group = np.unique(roots, return_inverse = True)
+
+        masses = np.array([p_list[i].mass for i in members.tolist()], dtype = float)
+        velocities = np.array([(p_list[i].velocity.x, p_list[i].velocity.y) for i in members.tolist()])
+
+        # 每组的总质量与总动量
+        total_mass = np.bincount(group, masses)
+        momentum_x = np.bincount(group, masses * velocities[:, 0])
+        momentum_y = np.bincount(group, masses * velocities[:, 1])
+
+        # 每组中质量最大的粒子保留下来，质量相同时序号较小者保留
+        order = np.lexsort((members, -masses, group))
+        first = np.ones(len(order), dtype = bool)
+        first[1:] = group[order][1:] != group[order][:-1]
+
+        for k, absorber in zip(order.tolist(), first.tolist()):
+            p = p_list[members[k]]
+            if absorber:
+                g = group[k]
+                p.update_mass(float(total_mass[g]))
+                p.velocity = pygame.Vector2(float(momentum_x[g]), float(momentum_y[g])) / float(total_mass[g])
+            else:
+                self.combined.append(p)
+
     def attract(self):
+        self.evaluations += 1
+        if self.solver == 'barnes-hut':
+            self.attract_tree()
+        else:
+            self.attract_exact()
+
+    def gather(self, p_list):
+        # 将粒子的状态收集为 NumPy 数组
+        positions = np.array([(p.position.x, p.position.y) for p in p_list]).reshape(-1, 2)
+        masses = np.array([p.mass for p in p_list], dtype = float)
+        radii = np.array([p.radius for p in p_list], dtype = float)
+        return positions, masses, radii
+
+    def apply(self, p_list, acc, pairs):
+        for p, a in zip(p_list, acc.tolist()):
+            p.acceleration = pygame.Vector2(a)
+
+        self.merge(p_list, pairs)
+
+    def attract_exact(self):
         p_list = self.sprites()
+        if not p_list:
+            return
 
-        for p in p_list:
-            p.acceleration = pygame.Vector2(0, 0)
-
-        for i, p1 in enumerate(p_list):
-            for p2 in p_list[i+1:]:
-                r1 = p1.position
-                r2 = p2.position
-                m1 = p1.mass
-                m2 = p2.mass
-
-                r = r2 - r1
-                d = r.length()
-                
-                if d < p1.radius + p2.radius:
-                    if not ((p1 in self.combined) or (p2 in self.combined)):
-                        v1 = p1.velocity
-                        v2 = p2.velocity
-
-                        mm = m1 + m2
-                        #rr = (m1 * r1 + m2 * r2) / mm
-                        vv = (m1 * v1 + m2 * v2) / mm
-
-                        if m1 >= m2:
-                            p1.update_mass(mm)
-                            p1.velocity = vv
-                            self.combined.append(p2)
-                        else:
-                            p2.update_mass(mm)
-                            p2.velocity = vv
-                            self.combined.append(p1)
-                else:
-                    fr = r / d ** 3
-                    p1.acceleration += m2 * fr
-                    p2.acceleration -= m1 * fr
+        # 分块向量化计算所有粒子对，加速度与待合并粒子对来自同一个距离矩阵
+        positions, masses, radii = self.gather(p_list)
+        acc, pairs = gravity.accelerations(positions, masses, radii)
+        self.apply(p_list, acc, pairs)
 
-    def update(self, dt):
-        self.attract()
+    def attract_tree(self):
+        p_list = self.sprites()
+        if not p_list:
+            return
+
+        positions, masses, radii = self.gather(p_list)
+        if len(p_list) < self.direct_below:
+            acc, pairs = gravity.accelerations(positions, masses, radii)
+            self.error = 0.0
+            self.apply(p_list, acc, pairs)
+            return
+
+        acc = QuadTree(positions, masses, radii).accelerations(self.theta)
+        # 待合并的粒子对与精确计算相同
+        self.spatial.build(positions, radii)
+        pairs = self.spatial.pairs(positions, radii)
+        # 误差估计需要对抽样粒子进行精确计算，只是偶尔进行
+        if self.error is None or self.evaluations % self.error_every == 0:
+            self.error = self.measure_error(positions, masses, radii, acc)
+        self.apply(p_list, acc, pairs)
 
+    def measure_error(self, positions, masses, radii, acc):
+        # 抽取部分粒子，与精确计算的加速度比较，得到均方根相对误差
+        num = len(positions)
+        sample = np.unique(np.linspace(0, num - 1, min(num, self.error_samples)).astype(int))
+        exact, _ = gravity.accelerations(positions, masses, radii, sample)
+
+        norm = (exact ** 2).sum()
+        if norm == 0:
+            return 0.0
+        return math.sqrt(((acc[sample] - exact) ** 2).sum() / norm)
+
+    def absorb(self):
+        # 移除被吞并的粒子，返回被移除的粒子个数
+        merged = len(self.combined)
         for sprite in self.combined:
             sprite.kill()
         self.combined.clear()
+        return merged
+
+    def energy(self):
+        # 总动能与引力势能之和，用于观察积分方法的能量漂移
+        p_list = self.sprites()
+        positions, masses, radii = self.gather(p_list)
+        velocities = np.array([(p.velocity.x, p.velocity.y) for p in p_list]).reshape(-1, 2)
+        kinetic = 0.5 * float((masses * (velocities ** 2).sum(axis = 1)).sum())
+        return kinetic + gravity.potential(positions, masses, radii)
+
+    def update(self, dt):
+        if self.integrator == 'leapfrog':
+            self.update_leapfrog(dt)
+        elif self.integrator == 'yoshida4':
+            self.update_yoshida(dt)
+        else:
+            self.update_euler(dt)
+
+    def update_euler(self, dt):
+        self.attract()
+        self.absorb()
 
         for sprite in self.sprites():
             sprite.update(dt)
+        self.synced = False
+
+    def update_leapfrog(self, dt):
+        # kick-drift-kick：半步速度、整步位置、以新位置的加速度再更新半步速度
+        if not self.synced:
+            self.attract()
+            self.absorb()
+
+        for sprite in self.sprites():
+            sprite.previous.update(sprite.position)
+            sprite.kick(dt / 2)
+            sprite.drift(dt)
+
+        self.attract()
+        merged = self.absorb()
+        for sprite in self.sprites():
+            sprite.kick(dt / 2)
+        # 发生合并时，其余粒子的加速度是按合并前的质量分布计算的，下一步需要重新计算
+        self.synced = not merged
+
+    def update_yoshida(self, dt):
+        # drift-kick 交替进行四次位置更新和三次速度更新，中间一次的步长为负
+        for sprite in self.sprites():
+            sprite.previous.update(sprite.position)
+
+        for drift, kick in zip(yoshida_drifts, yoshida_kicks):
+            for sprite in self.sprites():
+                sprite.drift(drift * dt)
+            self.attract()
+            self.absorb()
+            for sprite in self.sprites():
+                sprite.kick(kick * dt)
+
+        for sprite in self.sprites():
+            sprite.drift(yoshida_drifts[-1] * dt)
+        self.synced = False
@@ -1,6 +1,8 @@
 import pygame
 import math
 
+from cache import circle_image
+
 class Particle(pygame.sprite.Sprite):
     def __init__(self, position, velocity, mass, *groups):
         super().__init__(*groups)
@@ -8,6 +10,8 @@ class Particle(pygame.sprite.Sprite):
         self.position = pygame.Vector2(position)
         self.velocity = pygame.Vector2(velocity)
         self.acceleration = pygame.Vector2(0, 0)
+        # 上一步的位置，用于插值绘制
+        self.previous = self.position.copy()
 
         self.update_mass(mass)
 
@@ -23,9 +27,8 @@ class Particle(pygame.sprite.Sprite):
         self.update_image(self.radius)
 
     def update_image(self, radius):
-        self.image = pygame.Surface((2 * radius, 2 * radius))
-        self.image.set_colorkey('black')
-        pygame.draw.circle(self.image, self.color, (radius, radius), radius)
+        # 从共享缓存中取出图像，缩放时无需重新绘制
+        self.image = circle_image(radius, self.color)
 
     def scale_image(self, scale):
 
@@ -35,6 +38,20 @@ class Particle(pygame.sprite.Sprite):
             self.scale_radius = radius
             self.update_image(radius)
 
-    def update(self, dt):
+    def render_position(self, alpha):
+        # 在上一步与当前位置之间线性插值
+        return self.previous.lerp(self.position, alpha)
+
+    def kick(self, dt):
+        # 以当前加速度更新速度
         self.velocity += self.acceleration * dt
+
+    def drift(self, dt):
+        # 以当前速度更新位置，原地修改
         self.position += self.velocity * dt
+
+    def update(self, dt):
+        # 半隐式欧拉法：先更新速度，再以新速度更新位置
+        self.previous.update(self.position)
+        self.kick(dt)
+        self.drift(dt)
@@ -0,0 +1,90 @@
+import time
+from collections import deque
+
+import pygame
+import numpy as np
+
+class Profiler:
+
+    """ 帧耗时分析类：统计每帧中各个阶段的耗时
+
+    Profiler(window)
+
+    每帧开始时调用 start()，每个阶段结束时调用 mark(phase)，
+    上一次 start() 或 mark() 至今的时间计入 phase，帧结束时调用 end()。
+    保留最近 window 帧的数据，draw(debug) 在游戏界面上显示各阶段耗时的分位数。
+    未启用时 start()、mark()、end() 只判断一次 enabled 即返回
+
+    """
+
+    def __init__(self, window = 120):
+        self.enabled = False
+        self.window = window
+
+        # 各阶段最近 window 帧的耗时，单位为纳秒
+        self.samples = {}
+        # 本帧中各阶段累计的耗时，同一阶段在一帧中可以多次计时（如多个物理步长）
+        self.frame = {}
+        self.last = 0
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.samples.clear()
+        self.frame.clear()
+        # 在帧中途启用时，从此刻开始计时
+        self.last = time.perf_counter_ns()
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.last = time.perf_counter_ns()
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        self.frame[phase] = self.frame.get(phase, 0) + now - self.last
+        self.last = now
+
+    def end(self):
+        if not self.enabled:
+            return
+        # 各阶段按首次出现的顺序排列，本帧未经过的阶段记为 0
+        for phase in self.frame:
+            if phase not in self.samples:
+                self.samples[phase] = deque(maxlen = self.window)
+        for phase, samples in self.samples.items():
+            samples.append(self.frame.get(phase, 0))
+        self.frame.clear()
+
+    def percentiles(self, phase, q = (50, 95, 99)):
+        # 返回耗时的分位数，单位为毫秒
+        return np.percentile(self.samples[phase], q) / 1e6
+
+    def draw(self, debug, budget):
+
+        """ 在游戏界面左侧逐行显示各阶段耗时
+
+        draw(debug, budget)
+
+        每行显示阶段名称以及耗时的 p50、p95、p99，
+        右侧的横条长度表示 p50 耗时占一帧时间 budget（毫秒）的比例
+        返回绘制过的所有矩形区域
+
+        """
+
+        rects = []
+        if not self.enabled:
+            return rects
+
+        total = 0.0
+        for line, phase in enumerate(self.samples):
+            p50, p95, p99 = self.percentiles(phase)
+            total += p50
+            rect = debug.debug(f"{phase:<8} {p50:6.2f} {p95:6.2f} {p99:6.2f} ms", 'yellow', 'midleft', line)
+            bar = pygame.Rect(rect.right + 6, rect.top + 4, min(200, 200 * p50 / budget), rect.height - 8)
+            rects.append(rect)
+            rects.append(pygame.draw.rect(debug.screen, 'yellow', bar))
+        rects.append(debug.debug(f"{'total':<8} {total:6.2f} / {budget:.2f} ms (p50)", 'yellow', 'midleft', len(self.samples)))
+
+        return rects
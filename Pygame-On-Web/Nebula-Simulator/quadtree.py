@@ -0,0 +1,234 @@
+import numpy as np
+
+def spread(v):
+    # 在 16 位整数的相邻两位之间插入 0
+    v = v.astype(np.uint64)
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+def expand(first, start, count):
+    # 将每个 first[k] 与 [start[k], start[k] + count[k]) 中的序号依次配对
+    total = count.sum()
+    firsts = np.repeat(first, count)
+    offsets = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+    seconds = np.repeat(start, count) + offsets
+    return firsts, seconds
+
+class QuadTree:
+
+    """ Barnes–Hut 四叉树引力计算
+
+    QuadTree(positions, masses, radii, leaf_size, max_depth)
+
+    远处的一组粒子用其总质量和质心近似，
+    节点边长与距离之比小于张角 theta 时不再展开，
+    每帧计算复杂度约为 O(n log n)
+
+    粒子按 Morton 码（x、y 坐标各位交错排列）排序后，每个节点中的粒子在排序后连续存放，
+    整棵树逐层以向量化计算建立，节点按层存放，每个节点的子节点序号连续
+
+    """
+
+    def __init__(self, positions, masses, radii, leaf_size = 16, max_depth = 16):
+        self.positions = positions
+        self.masses = masses
+        self.radii = radii
+        self.leaf_size = leaf_size
+        self.max_depth = max_depth
+
+        # 根节点为包含所有粒子的最小正方形
+        lower = positions.min(axis = 0)
+        upper = positions.max(axis = 0)
+        center = (lower + upper) / 2
+        half = max((upper - lower).max() / 2, 1.0)
+
+        # 将根节点划分为 2^max_depth × 2^max_depth 个网格，按网格的 Morton 码排序
+        cells = 1 << max_depth
+        grid = np.clip(((positions - (center - half)) * (cells / (2 * half))).astype(np.int64), 0, cells - 1)
+        codes = spread(grid[:, 0]) | (spread(grid[:, 1]) << 1)
+        self.order = np.argsort(codes, kind = 'stable')
+        self.codes = codes[self.order]
+        self.grid = grid[self.order]
+
+        self.x = positions[self.order, 0]
+        self.y = positions[self.order, 1]
+        self.m = masses[self.order]
+        self.r = radii[self.order]
+
+        self.build(center - half, half)
+
+    def build(self, origin, half):
+        # 质量与质量矩的前缀和，任意连续区间的总质量和质心都可以直接得到
+        mass = np.concatenate(([0.0], np.cumsum(self.m)))
+        moment_x = np.concatenate(([0.0], np.cumsum(self.m * self.x)))
+        moment_y = np.concatenate(([0.0], np.cumsum(self.m * self.y)))
+
+        # 每一层的节点为 Morton 码前缀相同的连续区间
+        starts = [np.zeros(1, dtype = int)]
+        counts = [np.array([len(self.x)])]
+        levels = [np.zeros(1, dtype = int)]
+        child_counts = []
+        level = 0
+        while True:
+            start, count = starts[-1], counts[-1]
+            # 粒子数较少或者层数过深（粒子重合）时作为叶节点
+            split = (count > self.leaf_size) & (level < self.max_depth)
+            if not split.any():
+                child_counts.append(np.zeros(len(start), dtype = int))
+                break
+            level += 1
+
+            # 被分裂节点中的粒子按下一层的前缀划分为子节点
+            parents, members = expand(np.nonzero(split)[0], start[split], count[split])
+            prefix = self.codes[members] >> np.uint64(2 * (self.max_depth - level))
+            boundary = np.ones(len(members), dtype = bool)
+            boundary[1:] = (prefix[1:] != prefix[:-1]) | (parents[1:] != parents[:-1])
+            first = np.nonzero(boundary)[0]
+
+            child_counts.append(np.bincount(parents[first], minlength = len(start)))
+            starts.append(members[first])
+            counts.append(np.diff(np.append(first, len(members))))
+            levels.append(np.full(len(first), level))
+
+        start = np.concatenate(starts)
+        count = np.concatenate(counts)
+        level = np.concatenate(levels)
+        self.child_count = np.concatenate(child_counts)
+        # 各层节点依次编号，同一节点的子节点在下一层中连续存放
+        self.child_start = len(starts[0]) + np.cumsum(self.child_count) - self.child_count
+
+        self.node_mass = mass[start + count] - mass[start]
+        self.node_com = np.stack(((moment_x[start + count] - moment_x[start]) / self.node_mass,
+                                  (moment_y[start + count] - moment_y[start]) / self.node_mass), axis = 1)
+        self.node_half = half / 2.0 ** level
+        # 节点所在网格由其中任意一个粒子的网格坐标得到
+        cell = self.grid[start] >> (self.max_depth - level)[:, None]
+        self.node_center = origin + (cell + 0.5) * (2 * self.node_half)[:, None]
+
+        # 叶节点按其中粒子的起始位置排列，恰好依次覆盖所有粒子
+        leaves = np.nonzero(self.child_count == 0)[0]
+        leaves = leaves[np.argsort(start[leaves])]
+        self.leaf_of = np.full(len(start), -1)
+        self.leaf_of[leaves] = np.arange(len(leaves))
+        self.leaf_start = start[leaves]
+        self.leaf_count = count[leaves]
+
+    def accelerations(self, theta = 0.5, tile = 1 << 16):
+        """ 计算所有粒子受到的引力加速度
+
+        accelerations(theta, tile)
+
+        以叶节点中的一组粒子为单位自根节点逐层向下遍历，
+        节点与这组粒子包围盒的最近距离足够远时，用节点的总质量和质心近似，
+        其余叶节点之间逐对精确计算，每次最多处理约 tile 个粒子对。
+        与 gravity.accelerations() 相同，相互接触的粒子对不计算引力，
+        但接触检测与 theta 无关，由调用者另行完成
+
+        """
+
+        # 每个叶节点中粒子的包围盒
+        lower = np.stack((np.minimum.reduceat(self.x, self.leaf_start), np.minimum.reduceat(self.y, self.leaf_start)), axis = 1)
+        upper = np.stack((np.maximum.reduceat(self.x, self.leaf_start), np.maximum.reduceat(self.y, self.leaf_start)), axis = 1)
+
+        # 待处理的 (叶节点, 节点) 对，开始时每个叶节点都与根节点配对
+        groups = np.arange(len(self.leaf_start))
+        nodes = np.zeros(len(self.leaf_start), dtype = int)
+        far = []
+        near = []
+        while groups.size:
+            com = self.node_com[nodes]
+            half = self.node_half[nodes]
+            # 节点质心到包围盒的最近距离
+            gap = np.maximum(np.maximum(lower[groups] - com, com - upper[groups]), 0)
+            d = np.sqrt((gap ** 2).sum(axis = 1))
+            # 节点与包围盒相交时，节点中可能包含这组粒子本身，不能近似
+            box_center = (lower[groups] + upper[groups]) / 2
+            box_half = (upper[groups] - lower[groups]) / 2
+            apart = (np.abs(box_center - self.node_center[nodes]) > box_half + half[:, None]).any(axis = 1)
+            accept = apart & (2 * half < theta * d)
+            far.append((groups[accept], nodes[accept]))
+
+            # 叶节点：稍后逐对精确计算
+            rest = ~accept
+            leaf = rest & (self.child_count[nodes] == 0)
+            near.append((groups[leaf], nodes[leaf]))
+
+            # 其余节点展开为子节点
+            opened = rest & ~leaf
+            groups, nodes = expand(groups[opened], self.child_start[nodes[opened]], self.child_count[nodes[opened]])
+
+        # 按排序后的粒子顺序累加加速度
+        self.acc_x = np.zeros(len(self.x))
+        self.acc_y = np.zeros(len(self.x))
+
+        groups = np.concatenate([pair[0] for pair in far])
+        nodes = np.concatenate([pair[1] for pair in far])
+        for chunk in self.chunks(self.leaf_count[groups], tile):
+            self.far_field(groups[chunk], nodes[chunk])
+
+        # 两个方向都需要逐对计算的叶节点对只计算一次，由作用力与反作用力同时得到双方的加速度
+        groups = np.concatenate([pair[0] for pair in near])
+        sources = self.leaf_of[np.concatenate([pair[1] for pair in near])]
+        leaves = len(self.leaf_start)
+        mutual = np.isin(sources * leaves + groups, groups * leaves + sources)
+        once = ~mutual | (groups <= sources)
+        groups, sources, mutual = groups[once], sources[once], mutual[once]
+        for chunk in self.chunks(self.leaf_count[groups] * self.leaf_count[sources], tile):
+            self.near_field(groups[chunk], sources[chunk], mutual[chunk])
+
+        # 恢复为排序前的粒子顺序
+        acc = np.zeros_like(self.positions)
+        acc[self.order, 0] = self.acc_x
+        acc[self.order, 1] = self.acc_y
+        return acc
+
+    def chunks(self, sizes, tile):
+        # 将连续的若干项分为一批，每批的 sizes 之和约为 tile
+        ends = np.cumsum(sizes)
+        start = 0
+        while start < len(sizes):
+            stop = max(start + 1, int(np.searchsorted(ends, ends[start] - sizes[start] + tile, side = 'right')))
+            yield slice(start, stop)
+            start = stop
+
+    def far_field(self, groups, nodes):
+        # 叶节点中的每个粒子受到节点总质量的引力
+        nodes, rows = expand(nodes, self.leaf_start[groups], self.leaf_count[groups])
+        dx = self.node_com[nodes, 0] - self.x[rows]
+        dy = self.node_com[nodes, 1] - self.y[rows]
+        d2 = dx * dx + dy * dy
+        scale = self.node_mass[nodes] / (d2 * np.sqrt(d2))
+        self.acc_x += np.bincount(rows, dx * scale, minlength = len(self.x))
+        self.acc_y += np.bincount(rows, dy * scale, minlength = len(self.x))
+
+    def near_field(self, groups, sources, mutual):
+        # 叶节点中的每个粒子与另一个叶节点中的每个粒子逐对计算
+        # 先将叶节点对展开为 (粒子, 叶节点) 对，再展开为粒子对
+        pair, rows = expand(np.arange(len(groups)), self.leaf_start[groups], self.leaf_count[groups])
+        k, cols = expand(np.arange(len(rows)), self.leaf_start[sources][pair], self.leaf_count[sources][pair])
+        rows, pair = rows[k], pair[k]
+        mutual = mutual[pair]
+        # 同一个叶节点中的粒子对只计算 rows < cols 的一次
+        keep = (rows < cols) | ((groups[pair] != sources[pair]) & (rows != cols))
+        rows, cols, mutual = rows[keep], cols[keep], mutual[keep]
+
+        dx = self.x[cols] - self.x[rows]
+        dy = self.y[cols] - self.y[rows]
+        d2 = dx * dx + dy * dy
+        touch = self.r[rows] + self.r[cols]
+        pull = d2 >= touch * touch
+        d2 = np.where(pull, d2, 1.0)
+        inv_d3 = pull / (d2 * np.sqrt(d2))
+        fx = dx * inv_d3
+        fy = dy * inv_d3
+
+        num = len(self.x)
+        self.acc_x += np.bincount(rows, fx * self.m[cols], minlength = num)
+        self.acc_y += np.bincount(rows, fy * self.m[cols], minlength = num)
+        # 反作用力
+        back = self.m[rows] * mutual
+        self.acc_x -= np.bincount(cols, fx * back, minlength = num)
+        self.acc_y -= np.bincount(cols, fy * back, minlength = num)
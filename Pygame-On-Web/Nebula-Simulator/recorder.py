@@ -0,0 +1,222 @@
+""" 轨迹记录与回放模块
+
+Recorder(path, fields, meta)
+Trajectory(path)
+
+轨迹文件为只追加写入的分块压缩格式：
+
+    magic (8 字节) | version (uint32) | header 长度 (uint32) | header (JSON)
+    chunk | chunk | ...
+
+header 记录 meta 信息以及每一帧中各个数组的名称、dtype 和列数。
+每个 chunk 由固定长度的块头和 zlib 压缩后的数据组成：
+
+    'CHNK' | 起始帧序号 | 帧数 | 压缩前字节数 | 压缩后字节数 (uint32)
+
+压缩前的数据依次存放每一帧：粒子个数 (uint32) 以及按 header 顺序排列的各个数组。
+读取时只需依次读取块头并跳过压缩数据，即可建立帧序号到 chunk 的索引，
+程序中途退出时，文件末尾不完整的 chunk 会被忽略。
+
+"""
+
+import json
+import queue
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+MAGIC = b'PGTRAJ\r\n'
+VERSION = 1
+
+prefix = struct.Struct('<8sII')
+chunk_header = struct.Struct('<4sIIII')
+frame_header = struct.Struct('<I')
+
+class Recorder:
+
+    """ 轨迹记录类
+
+    Recorder(path, fields, meta, chunk_frames, queue_size)
+
+    fields 为 {名称: (dtype, 列数)} 字典，record(arrays) 记录一帧中的各个数组。
+    每 chunk_frames 帧打包为一个 chunk，交给后台线程压缩并写入文件，
+    等待写入的 chunk 最多 queue_size 个，队列已满时丢弃该 chunk 而不阻塞游戏主循环，丢弃的帧数计入 dropped；
+    close() 时等待后台线程写完剩余的 chunk，后台线程出错退出时不再等待，错误保存在 error 中
+
+    """
+
+    def __init__(self, path, fields, meta = None, chunk_frames = 64, queue_size = 8, level = 1):
+        self.fields = {name: (np.dtype(dtype), width) for name, (dtype, width) in fields.items()}
+        self.chunk_frames = chunk_frames
+        self.level = level
+
+        header = {'meta': meta or {},
+                  'fields': {name: [dtype.str, width] for name, (dtype, width) in self.fields.items()}}
+        header = json.dumps(header).encode('utf-8')
+
+        self.file = open(path, 'wb')
+        self.file.write(prefix.pack(MAGIC, VERSION, len(header)))
+        self.file.write(header)
+
+        # 已记录的帧数、因队列已满或后台线程退出而丢弃的帧数
+        self.frames = 0
+        self.dropped = 0
+        # 后台线程写入时发生的异常
+        self.error = None
+
+        # 当前 chunk 中各帧的数据及其起始帧序号
+        self.buffer = []
+        self.first = 0
+
+        self.queue = queue.Queue(maxsize = queue_size)
+        self.thread = threading.Thread(target = self.write, daemon = True)
+        self.thread.start()
+
+    def record(self, arrays):
+        # 在主线程中只复制数据，压缩和写入由后台线程完成
+        num = len(next(iter(arrays.values())))
+        parts = [frame_header.pack(num)]
+        for name, (dtype, width) in self.fields.items():
+            parts.append(np.ascontiguousarray(arrays[name], dtype = dtype).tobytes())
+        self.buffer.append(b''.join(parts))
+        self.frames += 1
+
+        if len(self.buffer) >= self.chunk_frames:
+            self.flush()
+
+    def put(self, item, timeout = 0.1):
+        # 只在 close() 中使用：队列已满时等待后台线程取走数据；后台线程已经退出时放弃，返回 False
+        while self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout = timeout)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def flush(self, block = False):
+        # 游戏主循环中不等待：压缩跟不上或后台线程已经退出时丢弃该 chunk
+        if not self.buffer:
+            return
+        item = (self.first, len(self.buffer), b''.join(self.buffer))
+        if block:
+            written = self.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+                written = self.thread.is_alive()
+            except queue.Full:
+                written = False
+        if not written:
+            self.dropped += len(self.buffer)
+        self.first = self.frames
+        self.buffer = []
+
+    def write(self):
+        # 后台线程：zlib 压缩时释放 GIL，不影响主线程
+        try:
+            while (item := self.queue.get()) is not None:
+                first, frames, data = item
+                compressed = zlib.compress(data, self.level)
+                self.file.write(chunk_header.pack(b'CHNK', first, frames, len(data), len(compressed)))
+                self.file.write(compressed)
+                self.file.flush()
+        except (OSError, ValueError) as error:
+            self.error = error
+
+    def close(self):
+        # 写入剩余的帧，等待后台线程结束；后台线程已经退出时不再等待
+        self.flush(block = True)
+        if self.put(None):
+            self.thread.join()
+        self.file.close()
+
+class Trajectory:
+
+    """ 轨迹读取类
+
+    Trajectory(path)
+
+    frame(index) 返回第 index 帧中的各个数组，可以随机访问任意一帧。
+    最近解压的 chunk 会被缓存，顺序回放时每个 chunk 只解压一次
+
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+        data = self.file.read(prefix.size)
+        if len(data) < prefix.size:
+            raise ValueError(f"{path} is not a trajectory file")
+        magic, version, header_size = prefix.unpack(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a trajectory file")
+        if version != VERSION:
+            raise ValueError(f"unsupported trajectory version {version} in {path}")
+        header = json.loads(self.file.read(header_size))
+
+        self.meta = header['meta']
+        self.fields = {name: (np.dtype(dtype), width) for name, (dtype, width) in header['fields'].items()}
+        # 每个粒子在一帧中占用的字节数
+        self.stride = sum(dtype.itemsize * width for dtype, width in self.fields.values())
+
+        self.scan()
+        self.cached = None
+
+    def scan(self):
+        # 依次读取块头，建立帧序号到 chunk 的索引
+        self.chunks = []
+        while len(data := self.file.read(chunk_header.size)) == chunk_header.size:
+            tag, first, frames, raw_size, size = chunk_header.unpack(data)
+            offset = self.file.tell()
+            # 文件末尾不完整的 chunk 直接忽略
+            if tag != b'CHNK' or len(self.file.read(size)) < size:
+                break
+            self.chunks.append((first, frames, offset, size))
+
+        self.firsts = [chunk[0] for chunk in self.chunks]
+        self.frames = self.chunks[-1][0] + self.chunks[-1][1] if self.chunks else 0
+
+    def load_chunk(self, k):
+        if self.cached and self.cached[0] == k:
+            return self.cached[1]
+
+        first, frames, offset, size = self.chunks[k]
+        self.file.seek(offset)
+        data = zlib.decompress(self.file.read(size))
+
+        # 记录每一帧在解压后数据中的位置
+        starts = []
+        position = 0
+        for i in range(frames):
+            num, = frame_header.unpack_from(data, position)
+            starts.append((position + frame_header.size, num))
+            position += frame_header.size + num * self.stride
+
+        self.cached = (k, (data, starts))
+        return data, starts
+
+    def frame(self, index):
+        if not self.chunks:
+            raise IndexError("empty trajectory")
+
+        # 丢弃的帧以其之前最近的一帧代替
+        k = max(0, bisect_right(self.firsts, index) - 1)
+        first, frames = self.chunks[k][:2]
+        data, starts = self.load_chunk(k)
+        position, num = starts[min(max(index - first, 0), frames - 1)]
+
+        arrays = {}
+        for name, (dtype, width) in self.fields.items():
+            count = num * width
+            array = np.frombuffer(data, dtype = dtype, count = count, offset = position)
+            arrays[name] = array.reshape(num, width) if width > 1 else array
+            position += count * dtype.itemsize
+
+        return arrays
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,85 @@
+import numpy as np
+
+class SpatialHash:
+
+    """ 均匀网格空间索引
+
+    SpatialHash()
+
+    build(positions, extents) 将所有对象按世界坐标放入边长为 size 的网格，
+    query(point) 返回 point 所在网格及周围 8 个网格中的对象序号（升序排列），
+    网格边长不小于对象尺寸的两倍，因此与 point 重叠的对象一定在返回结果中；
+    pairs(positions, extents) 返回相互重叠的所有对象对
+
+    """
+
+    def __init__(self, min_size = 16):
+        self.min_size = min_size
+        self.size = min_size
+
+        self.keys = np.zeros(0, dtype = np.int64)
+        self.order = np.zeros(0, dtype = int)
+        self.cells = np.zeros((0, 2))
+
+    def hash(self, ix, iy):
+        # 将二维网格坐标合并为一个整数
+        return (ix.astype(np.int64) << 32) + iy.astype(np.int64)
+
+    def build(self, positions, extents):
+        if len(positions):
+            self.size = max(self.min_size, 2 * float(extents.max()))
+        cells = np.floor(positions / self.size)
+        self.cells = cells
+
+        keys = self.hash(cells[:, 0], cells[:, 1])
+        self.order = np.argsort(keys, kind = 'stable')
+        self.keys = keys[self.order]
+
+    def query(self, point):
+        ix = np.floor(point[0] / self.size) + np.array((-1, 0, 1))
+        iy = np.floor(point[1] / self.size) + np.array((-1, 0, 1))
+        keys = self.hash(np.repeat(ix, 3), np.tile(iy, 3))
+
+        # 在排好序的键中二分查找，每个网格的查询复杂度为 O(log n)
+        starts = np.searchsorted(self.keys, keys, side = 'left')
+        stops = np.searchsorted(self.keys, keys, side = 'right')
+        found = [self.order[start:stop] for start, stop in zip(starts.tolist(), stops.tolist()) if stop > start]
+
+        if found:
+            return np.sort(np.concatenate(found))
+        else:
+            return np.zeros(0, dtype = int)
+
+    def pairs(self, positions, extents):
+        """ 找出相互重叠的对象对
+
+        pairs(positions, extents)
+
+        positions、extents 须与 build() 时相同，
+        返回距离小于二者尺寸之和的对象对 (i, j)，i < j，按字典序排列
+
+        """
+
+        num = len(positions)
+        found = []
+        # 重叠的对象一定位于相同或相邻的网格中，每对相邻网格只检查一次：
+        # 同一网格中只保留 i < j 的一次，另外只与右侧及下方的 4 个网格配对
+        for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+            keys = self.hash(self.cells[:, 0] + dx, self.cells[:, 1] + dy)
+            starts = np.searchsorted(self.keys, keys, side = 'left')
+            counts = np.searchsorted(self.keys, keys, side = 'right') - starts
+
+            # 每个对象与相邻网格中的对象依次配对
+            i = np.repeat(np.arange(num), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = self.order[np.repeat(starts, counts) + offsets]
+            if dx == 0 and dy == 0:
+                upper = i < j
+                i, j = i[upper], j[upper]
+
+            d2 = ((positions[i] - positions[j]) ** 2).sum(axis = 1)
+            touch = d2 < (extents[i] + extents[j]) ** 2
+            found.append(np.stack((np.minimum(i[touch], j[touch]), np.maximum(i[touch], j[touch])), axis = 1))
+
+        pairs = np.concatenate(found)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
@@ -0,0 +1,37 @@
+class FixedTimestep:
+
+    """ 固定时间步长调度器
+
+    FixedTimestep(step, max_steps)
+
+    每帧经历的时间 dt 累积到 accumulator 中，
+    物理更新始终以固定步长 step 进行，使物理过程与帧率无关、结果可重复。
+    每帧最多更新 max_steps 步，超出的时间直接丢弃，避免越算越慢的恶性循环。
+    alpha 为剩余时间占一步的比例，用于在前后两步之间插值绘制。
+
+    """
+
+    def __init__(self, step = 1 / 120, max_steps = 8):
+        self.step = step
+        self.max_steps = max_steps
+
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        # 因超出 max_steps 而丢弃的总时间
+        self.dropped = 0.0
+
+    def advance(self, dt):
+        # 返回本帧需要进行的物理更新步数
+        self.accumulator += dt
+        steps = int(self.accumulator // self.step)
+
+        if steps > self.max_steps:
+            excess = (steps - self.max_steps) * self.step
+            self.dropped += excess
+            self.accumulator -= excess
+            steps = self.max_steps
+
+        self.accumulator -= steps * self.step
+        self.alpha = min(1.0, max(0.0, self.accumulator / self.step))
+
+        return steps